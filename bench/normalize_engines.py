@@ -0,0 +1,55 @@
+import argparse
+import csv
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from csv_normilize import DELIM, ENGINES, run
+
+# fuzzed rows with non-ASCII spaces and digits, ligatures, ß and fullwidth letters
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "normalize_unicode.csv")
+
+
+def read_rows(path: str):
+    with open(path, encoding="utf-8", newline="") as f:
+        return list(csv.reader(f, delimiter=DELIM))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Check that every csv_normilize engine gives the rows engine's output.")
+    ap.add_argument("--fixture", default=FIXTURE)
+    ap.add_argument("--workers", type=int, default=2, help="Also run every engine with this many workers.")
+    args = ap.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="normalize_engines_")
+    try:
+        outputs = {}
+        for name in ENGINES:
+            for workers in sorted({1, args.workers}):
+                out = os.path.join(tmp_dir, f"{name}_x{workers}.csv")
+                run(args.fixture, out, name, workers)
+                outputs[f"{name} x{workers}"] = read_rows(out)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    expected = outputs.pop("rows x1")
+    header = expected[0]
+    bad = 0
+    for config, rows in outputs.items():
+        diffs = [(n, header[k], want, got) for n, (want_row, got_row) in enumerate(zip(expected, rows))
+                 for k, (want, got) in enumerate(zip(want_row, got_row)) if want != got]
+        if len(rows) != len(expected):
+            diffs.append((len(rows), "rows", len(expected), len(rows)))
+        for n, col, want, got in diffs[:20]:
+            print(f"{config}: line {n + 1} {col}: expected {want!r}, got {got!r}")
+        print(f"{config}: {len(diffs)} differences from rows x1")
+        bad += len(diffs)
+    if bad:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tab_to_csv import parse_tail
+
+# tail -> parse_tail output, recorded with the parse_tail that predates the precompiled patterns
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tab_tails_golden.jsonl")
+
+
+def load_golden(path: str = GOLDEN):
+    with open(path, encoding="utf-8") as f:
+        return [(tail, tuple(expected)) for tail, expected in map(json.loads, f)]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Check tab_to_csv.parse_tail against the golden corpus and time it.")
+    ap.add_argument("--golden", default=GOLDEN)
+    ap.add_argument("--repeat", type=int, default=5, help="Timing rounds; the best one is reported.")
+    args = ap.parse_args()
+
+    corpus = load_golden(args.golden)
+    bad = [(tail, expected, parse_tail(tail)) for tail, expected in corpus if parse_tail(tail) != expected]
+    for tail, expected, got in bad[:20]:
+        print(f"{tail!r}: expected {expected}, got {got}")
+    tails = [tail for tail, _ in corpus]
+    best = min(timeit.repeat(lambda: [parse_tail(t) for t in tails], number=1, repeat=args.repeat))
+    print(f"Tails: {len(corpus)}, mismatches: {len(bad)}; {len(tails) / best:,.0f} tails/s")
+    if bad:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+import argparse
+import ast
+import glob
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from functools import lru_cache
+
+from change_lang import NAME_COLUMNS as TRANSLIT_COLUMNS
+from table_io import strip_compression_ext
+
+CACHE_DIR = ".build_cache"
+HASH_BLOCK = 1024 * 1024
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# xls_to_csv has no CLI: it always reads this directory and writes this file
+XLSX_DIR = "./unzipped_xlsx"
+XLSX_OUTPUT = "flights_parsed.csv"
+
+
+def _parser(script: str) -> argparse.ArgumentParser:
+    return argparse.ArgumentParser(prog=f"build_cache.py {script}", add_help=False)
+
+
+def _converter_step(script: str, argv: list):
+    ap = _parser(script)
+    ap.add_argument("input")
+    ap.add_argument("output")
+    ap.add_argument("--source", default="")
+    ap.add_argument("--workers", default="1")
+    a = ap.parse_args(argv)
+    return [a.input], [a.output], {"source": a.source}
+
+
+def _tab_step(script: str, argv: list):
+    ap = _parser(script)
+    ap.add_argument("input")
+    ap.add_argument("output")
+    ap.add_argument("--source", default="tab")
+    ap.add_argument("--workers", default="1")
+    ap.add_argument("--rejects", default="")
+    a = ap.parse_args(argv)
+    rejects = a.rejects or os.path.splitext(strip_compression_ext(a.output))[0] + "_rejects.txt"
+    return [a.input], [a.output, rejects], {"source": a.source}
+
+
+def _normalize_step(script: str, argv: list):
+    ap = _parser(script)
+    ap.add_argument("input")
+    ap.add_argument("--output", "-o", default="")
+    ap.add_argument("--engine", default="columns")
+    ap.add_argument("--workers", default="1")
+    ap.add_argument("--bench", action="store_true")
+    a = ap.parse_args(argv)
+    if a.bench:
+        ap.error("--bench is not cached")
+    output = a.output or os.path.splitext(strip_compression_ext(a.input))[0] + "_normalized.csv"
+    return [a.input], [output], {"engine": a.engine}
+
+
+def _utc_step(script: str, argv: list):
+    ap = _parser(script)
+    ap.add_argument("input")
+    ap.add_argument("tz_map")
+    ap.add_argument("output", nargs="?", default="")
+    a = ap.parse_args(argv)
+    return [a.input, a.tz_map], [a.output or os.path.splitext(a.input)[0] + "_utc.csv"], {}
+
+
+def _translit_step(script: str, argv: list):
+    ap = _parser(script)
+    ap.add_argument("input")
+    ap.add_argument("--output", "-o", default="")
+    ap.add_argument("--columns", default=",".join(TRANSLIT_COLUMNS))
+    a = ap.parse_args(argv)
+    base, ext = os.path.splitext(a.input)
+    columns = [c.strip() for c in a.columns.split(",") if c.strip()]
+    return [a.input], [a.output or f"{base}_translit{ext}"], {"columns": columns}
+
+
+def _csv_step(script: str, argv: list):
+    ap = _parser(script)
+    ap.add_argument("input")
+    ap.add_argument("output", nargs="?", default="")
+    a = ap.parse_args(argv)
+    return [a.input], [a.output or os.path.splitext(a.input)[0] + "_normalized.csv"], {}
+
+
+def _xls_step(script: str, argv: list):
+    _parser(script).parse_args(argv)
+    return [os.path.join(XLSX_DIR, "*.xlsx")], [XLSX_OUTPUT], {}
+
+
+# script -> argv parser returning (input files or globs, output files, parameters that change the output);
+# --workers only changes how fast a script runs, so it is left out of the key
+STEPS = {
+    "json_to_csv": _converter_step,
+    "xml_to_csv": _converter_step,
+    "yaml_to_csv": _converter_step,
+    "tab_to_csv": _tab_step,
+    "xls_to_csv": _xls_step,
+    "csv_to_csv": _csv_step,
+    "csv_normilize": _normalize_step,
+    "change_lang": _translit_step,
+    "timezone_to_utc": _utc_step,
+}
+
+
+def output_format(path: str) -> str:
+    base = strip_compression_ext(path)
+    return (os.path.splitext(base)[1] + path[len(base):]).lower()
+
+
+@lru_cache(maxsize=None)
+def local_imports(module: str) -> tuple:
+    """Repo modules imported by module, transitively, including itself."""
+    seen = [module]
+    for name in seen:
+        with open(os.path.join(SCRIPT_DIR, name + ".py"), "rb") as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for dep in names:
+                if dep not in seen and os.path.isfile(os.path.join(SCRIPT_DIR, dep + ".py")):
+                    seen.append(dep)
+    return tuple(sorted(seen))
+
+
+@lru_cache(maxsize=None)
+def script_version(script: str) -> str:
+    """Hash of the script source and of every repo module it imports."""
+    h = hashlib.sha256()
+    for name in local_imports(script):
+        with open(os.path.join(SCRIPT_DIR, name + ".py"), "rb") as f:
+            h.update(name.encode() + b"\0" + hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+class BuildCache:
+    """Outputs of converter runs stored under a hash of everything that determines them.
+
+    The key covers the script version, the content and base name of every
+    input (converters derive the default source from the file name), the
+    output formats and the output-affecting parameters. File hashes are
+    remembered by (size, mtime) so unchanged inputs are not re-read.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, rehash: bool = False):
+        self.cache_dir = cache_dir
+        self.objects = os.path.join(cache_dir, "objects")
+        self.hashes_path = os.path.join(cache_dir, "hashes.json")
+        self.hashes = {}
+        if not rehash and os.path.exists(self.hashes_path):
+            with open(self.hashes_path, encoding="utf-8") as f:
+                self.hashes = json.load(f)
+        self.hits = self.misses = self.failures = 0
+        self.saved = 0.0
+        self.spent = 0.0
+        self.lock = threading.Lock()
+
+    def file_digest(self, path: str) -> str:
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        known = self.hashes.get(path)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                h.update(block)
+        self.hashes[path] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def _remember(self, path: str, digest: str):
+        st = os.stat(path)
+        self.hashes[os.path.abspath(path)] = [st.st_size, st.st_mtime_ns, digest]
+
+    def key(self, script: str, argv: list, cwd: str = ""):
+        inputs, outputs, params = STEPS[script](script, argv)
+        inputs = [q for p in inputs
+                  for q in (sorted(glob.glob(os.path.join(cwd, p))) if "*" in p else [os.path.join(cwd, p)])]
+        outputs = [os.path.join(cwd, p) for p in outputs]
+        for path in inputs:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(path)
+        desc = {
+            "script": script,
+            "version": script_version(script),
+            "params": params,
+            "inputs": [[os.path.basename(p), self.file_digest(p)] for p in inputs],
+            "formats": [output_format(p) for p in outputs],
+        }
+        key = hashlib.sha256(json.dumps(desc, sort_keys=True).encode()).hexdigest()
+        return key, outputs
+
+    def _restore(self, obj_dir: str, meta: dict, outputs: list):
+        for i, digest in meta["outputs"].items():
+            dest = outputs[int(i)]
+            if os.path.exists(dest) and self.file_digest(dest) == digest:
+                continue
+            if os.path.dirname(dest):
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+            tmp = dest + ".cache-tmp"
+            shutil.copyfile(os.path.join(obj_dir, i), tmp)
+            os.replace(tmp, dest)
+            self._remember(dest, digest)
+
+    def _store(self, key: str, outputs: list, seconds: float, stdout: bytes):
+        obj_dir = os.path.join(self.objects, key)
+        tmp_dir = f"{obj_dir}.tmp{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        digests = {}
+        for i, path in enumerate(outputs):
+            if os.path.isfile(path):
+                digests[str(i)] = self.file_digest(path)
+                shutil.copyfile(path, os.path.join(tmp_dir, str(i)))
+        meta = {"outputs": digests, "seconds": seconds, "stdout": stdout.decode("utf-8", "replace"),
+                "created": time.time()}
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        try:
+            os.replace(tmp_dir, obj_dir)
+        except OSError:  # stored meanwhile by another run
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def run(self, script: str, argv: list, cwd: str = "") -> bool:
+        """Restore the outputs of script argv from the cache, or run it and cache them; False on failure.
+
+        Relative paths in argv are taken from cwd (default: the current directory).
+        Safe to call from several threads at once.
+        """
+        script = os.path.splitext(os.path.basename(script))[0]
+        label = " ".join([script] + [shlex.quote(a) for a in argv])
+        started = time.perf_counter()
+        try:
+            key, outputs = self.key(script, argv, cwd)
+        except FileNotFoundError as e:
+            self._report_step("failures", 0.0, 0.0, b"", f"FAIL {label}: missing input {e.args[0]}")
+            return False
+        obj_dir = os.path.join(self.objects, key)
+        meta_path = os.path.join(obj_dir, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            self._restore(obj_dir, meta, outputs)
+            took = time.perf_counter() - started
+            saved = max(meta["seconds"] - took, 0.0)
+            self._report_step("hits", took, saved, meta["stdout"].encode("utf-8"),
+                              f"hit  {label} (saved {saved:.1f}s)")
+            return True
+
+        proc = subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, script + ".py"), *argv],
+                              stdout=subprocess.PIPE, cwd=cwd or None)
+        seconds = time.perf_counter() - started
+        if proc.returncode:
+            self._report_step("failures", seconds, 0.0, proc.stdout, f"FAIL {label}: exit code {proc.returncode}")
+            return False
+        self._store(key, outputs, seconds, proc.stdout)
+        self._report_step("misses", seconds, 0.0, proc.stdout, f"run  {label} ({seconds:.1f}s)")
+        return True
+
+    def _report_step(self, counter: str, spent: float, saved: float, stdout: bytes, line: str):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            self.spent += spent
+            self.saved += saved
+            sys.stdout.flush()
+            sys.stdout.buffer.write(stdout)
+            print(line, flush=True)
+
+    def save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = self.hashes_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.hashes, f)
+        os.replace(tmp, self.hashes_path)
+
+    def report(self):
+        print(f"Steps: {self.hits + self.misses + self.failures}, cache hits: {self.hits}, "
+              f"recomputed: {self.misses}, failed: {self.failures}; "
+              f"time saved: {self.saved:.1f}s, time spent: {self.spent:.1f}s")
+
+
+def read_jobs(path: str) -> list:
+    jobs = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                jobs.append(shlex.split(line))
+    return jobs
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Run converter and post-processing scripts through a content-hash build cache.",
+        epilog=f"Cached scripts: {', '.join(STEPS)}.")
+    ap.add_argument("command", nargs=argparse.REMAINDER,
+                    help="Script and its arguments, e.g. json_to_csv forum.json forum.csv --source forum.")
+    ap.add_argument("--jobs", default="", help="File with one 'script args...' command per line.")
+    ap.add_argument("--cache-dir", default=CACHE_DIR)
+    ap.add_argument("--rehash", action="store_true", help="Re-read every input instead of trusting size and mtime.")
+    args = ap.parse_args()
+
+    jobs = read_jobs(args.jobs) if args.jobs else []
+    if args.command:
+        jobs.append(args.command)
+    if not jobs:
+        ap.error("give a command or --jobs")
+    for job in jobs:
+        if os.path.splitext(os.path.basename(job[0]))[0] not in STEPS:
+            ap.error(f"not a cached script: {job[0]}")
+
+    cache = BuildCache(args.cache_dir, args.rehash)
+    try:
+        for job in jobs:
+            cache.run(job[0], job[1:])
+    finally:
+        cache.save()
+    cache.report()
+    if cache.failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
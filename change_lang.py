@@ -1,6 +1,12 @@
-import csv
+import argparse
 import os
 import sys
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from table_io import TableWriter, is_columnar, open_input, read_frame
 
 translit_map = {
     'А': 'A', 'Б': 'B', 'В': 'V', 'Г': 'G', 'Д': 'D',
@@ -16,49 +22,79 @@ for k, v in list(translit_map.items()):
     translit_map[k.lower()] = v.capitalize()
 
 
+TRANSLIT_TABLE = str.maketrans(translit_map)
+
+NAME_COLUMNS = ("real_first_name", "real_last_name")
+CHUNK_ROWS = 200_000
+
+
+@lru_cache(maxsize=1 << 16)
 def transliterate(text: str) -> str:
-    return ''.join(translit_map.get(ch, ch) for ch in text)
+    return text.translate(TRANSLIT_TABLE)
+
+
+def transliterate_column(values: pd.Series) -> pd.Series:
+    codes, uniques = pd.factorize(values.fillna("").astype(str))
+    out = np.asarray(pd.Series(uniques, dtype=object).str.translate(TRANSLIT_TABLE), dtype=object)
+    return pd.Series(out[codes], index=values.index, dtype=object)
+
+
+def transliterate_frame(df: pd.DataFrame, columns=NAME_COLUMNS) -> pd.DataFrame:
+    for col in columns:
+        if col in df.columns:
+            df[col] = transliterate_column(df[col])
+    return df
 
 
 def detect_delimiter(path):
-    with open(path, 'r', encoding='utf-8-sig') as f:
+    with open_input(path, 'r', encoding='utf-8-sig') as f:
         line = f.readline()
         if line.count(';') > line.count(','):
             return ';'
         return ','
 
 
-def main():
-    if len(sys.argv) < 2:
-        sys.exit(1)
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("input_csv")
+    ap.add_argument("--output", "-o", default="", help="Output CSV (default: <input>_translit<ext>).")
+    ap.add_argument("--columns", default=",".join(NAME_COLUMNS),
+                    help="Comma-separated columns to transliterate.")
+    return ap.parse_args()
+
 
-    input_file = sys.argv[1]
+def main():
+    args = parse_args()
+    input_file = args.input_csv
 
     if not os.path.isfile(input_file):
         sys.exit(1)
 
     base, ext = os.path.splitext(input_file)
-    output_file = f"{base}_translit{ext}"
-
-    delimiter = detect_delimiter(input_file)
-
-    with open(input_file, 'r', encoding='utf-8-sig', newline='') as infile, \
-            open(output_file, 'w', encoding='utf-8', newline='') as outfile:
-
-        reader = csv.DictReader(infile, delimiter=delimiter)
-        reader.fieldnames = [name.strip() for name in reader.fieldnames]
-        writer = csv.DictWriter(outfile, fieldnames=reader.fieldnames, delimiter=delimiter)
-        writer.writeheader()
-
-        for row in reader:
-            cleaned_row = {k.strip(): v.strip() if isinstance(v, str) else v for k, v in row.items()}
-
-            if 'real_first_name' in cleaned_row:
-                cleaned_row['real_first_name'] = transliterate(cleaned_row['real_first_name'])
-            if 'real_last_name' in cleaned_row:
-                cleaned_row['real_last_name'] = transliterate(cleaned_row['real_last_name'])
-
-            writer.writerow(cleaned_row)
+    output_file = args.output or f"{base}_translit{ext}"
+    columns = [c.strip() for c in args.columns.split(",") if c.strip()]
+
+    if is_columnar(input_file):
+        delimiter = ";"
+        chunks = [read_frame(input_file)]
+    else:
+        delimiter = detect_delimiter(input_file)
+        chunks = pd.read_csv(input_file, sep=delimiter, dtype=str, keep_default_na=False,
+                             encoding="utf-8-sig", chunksize=CHUNK_ROWS)
+
+    writer = None
+    try:
+        for df in chunks:
+            df.columns = [name.strip() for name in df.columns]
+            for col in df.columns:
+                df[col] = df[col].str.strip()
+            transliterate_frame(df, columns)
+            if writer is None:
+                writer = TableWriter(output_file, df.columns, sep=delimiter)
+            writer.write_frame(df)
+    finally:
+        if writer is not None:
+            writer.close()
 
 
 if __name__ == "__main__":
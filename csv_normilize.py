@@ -1,19 +1,51 @@
+import argparse
 import csv
+import io
 import os
 import re
+import shutil
 import sys
+import tempfile
+import time
+from collections import Counter
 from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from parallel_chunks import chunk_count, header_end, read_range, record_ranges, run_ordered, write_parts
+from schema import TARGET_COLUMNS as COLUMNS
+from table_io import (compression_of, is_columnar, open_input, open_output, read_frame,
+                      strip_compression_ext, table_columns, write_frame)
 
-COLUMNS = [
-    "real_first_name", "real_last_name", "birth_date",
-    "flight_date", "flight_time", "flight_no", "codeshare",
-    "dep_city", "dep_airport", "arr_city", "arr_airport",
-    "e_code", "e_ticket", "docs", "seat", "meal",
-    "booking_class", "fare_basis", "baggage", "loyalty_pairs",
-]
 
 DELIM = ";"
 
+DATE_FORMATS = (
+    "%Y-%m-%d",  # 2017-03-22
+    "%d/%m/%Y",  # 22/03/2017
+    "%m/%d/%Y",  # 03/22/2017
+    "%d.%m.%Y",  # 22.03.2017
+    "%Y/%m/%d",  # 2017/03/22
+    "%d-%m-%Y",  # 22-03-2017
+    "%m-%d-%Y",  # 03-22-2017
+)
+TIME_FORMATS = ("%H:%M", "%H:%M:%S")
+
+WS_RE = re.compile(r"\s+")
+HHMM_RE = re.compile(r"\s*(\d{1,2})(\d{2})\s*")
+FLIGHT_NO_RE = re.compile(r"([A-Z]{2,3})\s*[-\s_]*\s*(\d+)")
+AIRPORT_RE = re.compile(r"[A-Z]{3}")
+NON_ALNUM_RE = re.compile(r"[^0-9A-Za-z]")
+NON_DIGIT_RE = re.compile(r"\D")
+LETTER_RE = re.compile(r"[A-Z]")
+
+SEAT_EMPTY = frozenset({"N/A", "NA", "-", "NONE"})
+CODESHARE_YES = frozenset({"operated", "1", "yes"})
+
+MEMO_SIZE = 1 << 16
+
 def normalize_spaces_upper(s: str) -> str:
     if not s:
         return ""
@@ -21,20 +53,12 @@ def normalize_spaces_upper(s: str) -> str:
     return s.upper()
 
 
+@lru_cache(maxsize=MEMO_SIZE)
 def normalize_date(s: str) -> str:
     if not s or not s.strip():
         return ""
     s = s.strip()
-    fmts = [
-        "%Y-%m-%d",  # 2017-03-22
-        "%d/%m/%Y",  # 22/03/2017
-        "%m/%d/%Y",  # 03/22/2017
-        "%d.%m.%Y",  # 22.03.2017
-        "%Y/%m/%d",  # 2017/03/22
-        "%d-%m-%Y",  # 22-03-2017
-        "%m-%d-%Y",  # 03-22-2017
-    ]
-    for fmt in fmts:
+    for fmt in DATE_FORMATS:
         try:
             return datetime.strptime(s, fmt).strftime("%Y-%m-%d")
         except ValueError:
@@ -42,17 +66,17 @@ def normalize_date(s: str) -> str:
     return s
 
 
+@lru_cache(maxsize=MEMO_SIZE)
 def normalize_time(s: str) -> str:
     if not s or not s.strip():
         return ""
     s = s.strip()
-    fmts = ["%H:%M", "%H:%M:%S"]
-    for fmt in fmts:
+    for fmt in TIME_FORMATS:
         try:
             return datetime.strptime(s, fmt).strftime("%H:%M")
         except ValueError:
             continue
-    m = re.fullmatch(r"\s*(\d{1,2})(\d{2})\s*", s)
+    m = HHMM_RE.fullmatch(s)
     if m:
         hh = int(m.group(1))
         mm = int(m.group(2))
@@ -65,10 +89,10 @@ def normalize_flight_no(s: str) -> str:
     if not s or not s.strip():
         return ""
     s = s.strip().upper()
-    m = re.search(r"([A-Z]{2,3})\s*[-\s_]*\s*(\d+)", s)
+    m = FLIGHT_NO_RE.search(s)
     if m:
         return f"{m.group(1)}{m.group(2)}"
-    return re.sub(r"\s+", "", s)
+    return WS_RE.sub("", s)
 
 
 def normalize_codeshare(s: str) -> str:
@@ -77,11 +101,7 @@ def normalize_codeshare(s: str) -> str:
     v = s.strip().lower()
     if v == "":
         return "0"
-    if v in {"own", "0", "no", "none"}:
-        return "0"
-    if v in {"operated", "1", "yes"}:
-        return "1"
-    return "0"
+    return "1" if v in CODESHARE_YES else "0"
 
 
 def normalize_city(s: str) -> str:
@@ -92,34 +112,34 @@ def normalize_airport(s: str) -> str:
     if not s or not s.strip():
         return ""
     v = s.strip().upper()
-    return v if re.fullmatch(r"[A-Z]{3}", v) else ""
+    return v if AIRPORT_RE.fullmatch(v) else ""
 
 
 def normalize_e_code(s: str) -> str:
     if not s or not s.strip():
         return ""
-    v = re.sub(r"[^0-9A-Za-z]", "", s).upper()
+    v = NON_ALNUM_RE.sub("", s).upper()
     return v if len(v) == 6 else ""
 
 
 def normalize_e_ticket(s: str) -> str:
     if not s:
         return ""
-    digits = re.sub(r"\D", "", s)
+    digits = NON_DIGIT_RE.sub("", s)
     return digits if 13 <= len(digits) <= 16 else ""
 
 
 def normalize_docs(s: str) -> str:
     if not s:
         return ""
-    return re.sub(r"\s+", "", s)
+    return WS_RE.sub("", s)
 
 
 def normalize_seat(s: str) -> str:
     if not s or not s.strip():
         return ""
     v = s.strip()
-    if v.upper() in {"N/A", "NA", "-", "NONE"}:
+    if v.upper() in SEAT_EMPTY:
         return ""
     return v
 
@@ -134,9 +154,7 @@ def normalize_booking_class(s: str) -> str:
     if not s:
         return ""
     v = s.strip().upper().replace(" ", "")
-    if re.fullmatch(r"[A-Z]", v):
-        return v
-    m = re.search(r"[A-Z]", v)
+    m = LETTER_RE.search(v)
     return m.group(0) if m else ""
 
 
@@ -181,32 +199,199 @@ NORMALIZERS = {
 }
 
 
-def main():
-    in_path = sys.argv[1]
-    if not os.path.isfile(in_path):
-        sys.exit(1)
+BLANKING_COLUMNS = ("dep_airport", "arr_airport", "e_code", "e_ticket")
+
+
+def normalize_column(col: str, values: pd.Series) -> pd.Series:
+    """NORMALIZERS[col] over a whole column.
+
+    The scalar normalizer runs once per distinct value, on object dtype so
+    the Python re patterns (Unicode \\s, \\D, str.upper) apply rather than
+    pandas' Arrow string kernels, and the results are expanded back through
+    the factorize codes.
+    """
+    values = values.fillna("").astype(object)
+    codes, uniques = pd.factorize(values)
+    normalized = np.fromiter(map(NORMALIZERS[col], uniques), dtype=object, count=len(uniques))
+    return pd.Series(normalized[codes], index=values.index, dtype=object)
+
+
+def normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    out = {}
+    for col in COLUMNS:
+        raw = df[col] if col in df.columns else pd.Series("", index=df.index)
+        out[col] = normalize_column(col, raw)
+    return pd.DataFrame(out, columns=COLUMNS, index=df.index)
+
+
+def count_blanked(df: pd.DataFrame, out: pd.DataFrame) -> Counter:
+    counts = Counter()
+    for col in BLANKING_COLUMNS:
+        if col in df.columns:
+            raw = df[col].fillna("").astype(object).map(str.strip)
+            counts[col] += int(((raw != "") & (out[col] == "")).sum())
+    return counts
+
+
+def report_missing(fieldnames):
+    missing = [c for c in COLUMNS if c not in (fieldnames or [])]
+    for c in missing:
+        print(f"  - {c}")
+
 
-    out_path = os.path.splitext(in_path)[0] + "_normalized.csv"
+def normalize_row_stream(reader, writer) -> tuple:
+    n = 0
+    counts = Counter()
+    for row in reader:
+        out_row = {}
+        for col in COLUMNS:
+            raw_val = row.get(col, "")
+            norm_func = NORMALIZERS[col]
+            out_row[col] = norm_func(raw_val)
+        for col in BLANKING_COLUMNS:
+            raw_val = row.get(col)
+            if raw_val and raw_val.strip() and not out_row[col]:
+                counts[col] += 1
+        writer.writerow(out_row)
+        n += 1
+    return n, counts
 
-    with open(in_path, "r", encoding="utf-8-sig", newline="") as fin, \
-            open(out_path, "w", encoding="utf-8", newline="") as fout:
+
+def normalize_rows(in_path: str, out_path: str) -> tuple:
+    with open_input(in_path, "r", encoding="utf-8-sig", newline="") as fin, \
+            open_output(out_path, "w", encoding="utf-8", newline="") as fout:
 
         reader = csv.DictReader(fin, delimiter=DELIM)
-        missing = [c for c in COLUMNS if c not in reader.fieldnames]
-        if missing:
-            for c in missing:
-                print(f"  - {c}")
+        report_missing(reader.fieldnames)
 
         writer = csv.DictWriter(fout, fieldnames=COLUMNS, delimiter=DELIM)
         writer.writeheader()
+        return normalize_row_stream(reader, writer)
+
+
+def read_csv_frame(source, **kwargs) -> pd.DataFrame:
+    return pd.read_csv(source, sep=DELIM, dtype=str, keep_default_na=False, **kwargs)
+
+
+def normalize_columns(in_path: str, out_path: str) -> tuple:
+    if is_columnar(in_path):
+        present = [c for c in table_columns(in_path) if c in COLUMNS]
+        df = read_frame(in_path, columns=present)
+    else:
+        try:
+            df = read_frame(in_path, sep=DELIM)
+        except pd.errors.ParserError:
+            if is_columnar(out_path):
+                raise
+            return normalize_rows(in_path, out_path)
+        except pd.errors.EmptyDataError:
+            df = pd.DataFrame(columns=COLUMNS, dtype=str)
+    report_missing(list(df.columns))
+    out = normalize_frame(df)
+    write_frame(out, out_path, sep=DELIM)
+    return len(df), count_blanked(df, out)
+
+
+ENGINES = {
+    "columns": normalize_columns,
+    "rows": normalize_rows,
+}
+
+
+def normalize_chunk(task) -> tuple:
+    """Worker: normalize one header-less byte range into its own part file."""
+    in_path, start, end, fieldnames, part_path, engine = task
+    data = read_range(in_path, start, end)
+    with open(part_path, "w", encoding="utf-8", newline="") as fout:
+        if engine == "columns":
+            try:
+                df = read_csv_frame(io.BytesIO(data), header=None, names=fieldnames, encoding="utf-8")
+            except pd.errors.ParserError:
+                df = None
+            except pd.errors.EmptyDataError:
+                return 0, Counter()
+            if df is not None:
+                out = normalize_frame(df)
+                out.to_csv(fout, sep=DELIM, index=False, header=False, lineterminator="\r\n")
+                return len(df), count_blanked(df, out)
+        reader = csv.DictReader(io.StringIO(data.decode("utf-8"), newline=""),
+                                fieldnames=fieldnames, delimiter=DELIM)
+        writer = csv.DictWriter(fout, fieldnames=COLUMNS, delimiter=DELIM)
+        return normalize_row_stream(reader, writer)
+
+
+def normalize_parallel(in_path: str, out_path: str, engine: str, workers: int) -> tuple:
+    data_start = header_end(in_path)
+    header_text = read_range(in_path, 0, data_start).decode("utf-8-sig")
+    fieldnames = next(csv.reader(io.StringIO(header_text, newline=""), delimiter=DELIM), [])
+    report_missing(fieldnames)
+
+    ranges = record_ranges(in_path, chunk_count(workers), data_start)
+    tmp_root = None if out_path == os.devnull else os.path.dirname(os.path.abspath(out_path))
+    tmp_dir = tempfile.mkdtemp(prefix=".normalize_", dir=tmp_root)
+    parts = [os.path.join(tmp_dir, f"part{k:05d}.csv") for k in range(len(ranges))]
+    tasks = [(in_path, s, e, fieldnames, part, engine) for (s, e), part in zip(ranges, parts)]
+    try:
+        results = run_ordered(normalize_chunk, tasks, workers)
+        write_parts(parts, out_path, COLUMNS, sep=DELIM, lineterminator="\r\n")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    n = sum(r[0] for r in results)
+    counts = sum((r[1] for r in results), Counter())
+    return n, counts
+
+
+def run(in_path: str, out_path: str, engine: str = "columns", workers: int = 1) -> tuple:
+    if is_columnar(in_path):
+        return normalize_columns(in_path, out_path)
+    if workers > 1 and not compression_of(in_path, sniff=True):
+        return normalize_parallel(in_path, out_path, engine, workers)
+    if is_columnar(out_path):
+        return normalize_columns(in_path, out_path)
+    return ENGINES[engine](in_path, out_path)
+
+
+def bench(in_path: str, workers: int = 1):
+    configs = [(name, 1) for name in ENGINES]
+    if workers > 1:
+        configs += [(name, workers) for name in ENGINES]
+    for name, w in configs:
+        normalize_date.cache_clear()
+        normalize_time.cache_clear()
+        t0 = time.perf_counter()
+        n, _ = run(in_path, os.devnull, name, w)
+        dt = time.perf_counter() - t0
+        print(f"{name} x{w}: {n} rows in {dt:.2f}s ({n / dt if dt else 0:.0f} rows/s)")
+
+
+def parse_args():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("input_csv")
+    ap.add_argument("--output", "-o", default="",
+                    help="Output CSV/Parquet/Arrow file (default: <input>_normalized.csv).")
+    ap.add_argument("--engine", choices=sorted(ENGINES), default="columns")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Normalize line-aligned chunks of the input in this many processes.")
+    ap.add_argument("--bench", action="store_true", help="Time every engine on the input and exit.")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    in_path = args.input_csv
+    if not os.path.isfile(in_path):
+        sys.exit(1)
+
+    if args.bench:
+        bench(in_path, args.workers)
+        return
 
-        for row in reader:
-            out_row = {}
-            for col in COLUMNS:
-                raw_val = row.get(col, "")
-                norm_func = NORMALIZERS[col]
-                out_row[col] = norm_func(raw_val)
-            writer.writerow(out_row)
+    out_path = args.output or os.path.splitext(strip_compression_ext(in_path))[0] + "_normalized.csv"
+    _, blanked = run(in_path, out_path, args.engine, args.workers)
+    for col in BLANKING_COLUMNS:
+        if blanked[col]:
+            print(f"{col}: {blanked[col]} values blanked")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,133 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from schema import is_loyalty_card
+from table_io import write_frame
+
+try:
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components as _csgraph_components
+except ImportError:
+    coo_matrix = None
+
+# identifier columns linking passengers; loyalty_pairs holds several "|"-separated cards
+IDENTIFIER_COLUMNS = ("e_ticket", "docs", "loyalty_pairs", "e_code")
+MULTI_VALUE_COLUMNS = {"loyalty_pairs": "|"}
+# values that identify someone; placeholder cards such as "::" would link every cardless passenger
+VALID_VALUE = {"loyalty_pairs": is_loyalty_card}
+RING_MIN = 3
+
+
+def identifier_edges(df: pd.DataFrame, pid: np.ndarray, n_ids: int, columns=IDENTIFIER_COLUMNS):
+    """Distinct passenger -> identifier edges of the bipartite sharing graph.
+
+    Identifier nodes are numbered from n_ids on, separately per column, so
+    equal strings in different columns stay different nodes. Returns
+    (passenger, identifier node, total node count).
+    """
+    us, vs = [], []
+    offset = n_ids
+    for col in columns:
+        values = df[col].reset_index(drop=True)
+        rows = np.arange(len(values))
+        sep = MULTI_VALUE_COLUMNS.get(col)
+        if sep:
+            tokens = values.str.split(sep).explode().str.strip()
+            rows = tokens.index.to_numpy()
+            values = tokens.fillna("")
+        codes, distinct = pd.factorize(values)
+        valid = VALID_VALUE.get(col, bool)
+        mask = np.fromiter(map(valid, distinct), dtype=bool, count=len(distinct))[codes]
+        keys, uniques = pd.factorize(values[mask])
+        if not len(uniques):
+            continue
+        pairs = pd.unique(keys.astype(np.int64) * n_ids + pid[rows[mask]])
+        key_of, pid_of = np.divmod(pairs, n_ids)
+        us.append(pid_of)
+        vs.append(key_of + offset)
+        offset += len(uniques)
+    if not us:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), offset
+    return np.concatenate(us), np.concatenate(vs), offset
+
+
+def connected_components(n_nodes: int, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """Component label per node; uses scipy.sparse.csgraph when installed.
+
+    The numpy fallback hooks the larger root of every edge onto the smaller
+    one and compresses paths until no edge joins two roots, so each label is
+    the smallest node of its component.
+    """
+    if coo_matrix is not None:
+        graph = coo_matrix((np.ones(len(u), dtype=np.int8), (u, v)), shape=(n_nodes, n_nodes))
+        return _csgraph_components(graph, directed=False)[1]
+
+    parent = np.arange(n_nodes)
+    while True:
+        pu, pv = parent[u], parent[v]
+        live = pu != pv
+        if not live.any():
+            return parent
+        u, v = u[live], v[live]
+        lo, hi = np.minimum(pu[live], pv[live]), np.maximum(pu[live], pv[live])
+        np.minimum.at(parent, hi, lo)
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+
+
+def ring_features(df: pd.DataFrame, pid: np.ndarray, n_ids: int, columns=IDENTIFIER_COLUMNS) -> pd.DataFrame:
+    """Per-passenger sharing-graph features, indexed by passenger code.
+
+    component: component label; ring_size: passengers in the component;
+    ring_identifiers: identifiers in it; degree: the passenger's distinct
+    identifiers; max_shared: most passengers using any one of them.
+    """
+    u, v, n_nodes = identifier_edges(df, pid, n_ids, columns)
+    labels = connected_components(n_nodes, u, v)
+    _, comp = np.unique(labels, return_inverse=True)
+    n_comp = int(comp.max()) + 1 if n_nodes else 0
+    passengers = np.bincount(comp[:n_ids], minlength=n_comp)
+    identifiers = np.bincount(comp[n_ids:], minlength=n_comp)
+    ident_degree = np.bincount(v, minlength=n_nodes)
+    max_shared = np.zeros(n_ids, dtype=np.int64)
+    np.maximum.at(max_shared, u, ident_degree[v])
+    return pd.DataFrame({
+        "component": comp[:n_ids],
+        "ring_size": passengers[comp[:n_ids]],
+        "ring_identifiers": identifiers[comp[:n_ids]],
+        "degree": np.bincount(u, minlength=n_ids),
+        "max_shared": max_shared,
+    })
+
+
+def main():
+    from scoring import load_flights, passenger_ids
+
+    ap = argparse.ArgumentParser(description="Shared-identifier rings over merge_flights output.")
+    ap.add_argument("input", help="merge_flights output (.csv, .parquet or .arrow).")
+    ap.add_argument("--output", "-o", default="rings.csv", help="Per-passenger ring table.")
+    ap.add_argument("--ring-min", type=int, default=RING_MIN, help="Only write passengers in rings this large.")
+    args = ap.parse_args()
+
+    df = load_flights(args.input)
+    pid, ids = passenger_ids(df)
+    features = ring_features(df, pid, len(ids))
+    features.insert(0, "ID", ids)
+
+    sizes = features.drop_duplicates("component")["ring_size"]
+    print(f"passengers: {len(ids)}, components: {len(sizes)}, "
+          f"rings >= {args.ring_min}: {int((sizes >= args.ring_min).sum())}, largest: {int(sizes.max()) if len(sizes) else 0}")
+    print(f"identifier degree: mean {features['degree'].mean():.2f}, max {int(features['degree'].max()) if len(ids) else 0}")
+
+    rings = features[features["ring_size"] >= args.ring_min]
+    rings = rings.sort_values(["ring_size", "component", "ID"], ascending=[False, True, True], kind="stable")
+    write_frame(rings, args.output, sep=";", lineterminator="\n")
+
+
+if __name__ == "__main__":
+    main()
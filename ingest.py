@@ -0,0 +1,262 @@
+import argparse
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from build_cache import CACHE_DIR, SCRIPT_DIR, XLSX_DIR, XLSX_OUTPUT, BuildCache
+from schema import SOURCE_TO_TARGET, source_name
+from table_io import open_input, strip_compression_ext
+
+# source extension (after any compression extension) -> converter; a .csv is only taken
+# when it is an agency export (see is_agency_export), not any table lying around
+CONVERTERS = {
+    ".json": "json_to_csv",
+    ".xml": "xml_to_csv",
+    ".yaml": "yaml_to_csv",
+    ".yml": "yaml_to_csv",
+    ".tab": "tab_to_csv",
+    ".csv": "csv_to_csv",
+}
+STAGES = ("convert", "normalize", "translit", "utc", "merge")
+WORK_DIR = "ingest_work"
+DEFAULT_OUTPUT = "merged_flights.csv"
+DEFAULT_TZ_MAP = os.path.join(SCRIPT_DIR, "iata_timezone_map.csv")
+
+
+class Task:
+    def __init__(self, name: str, stage: str, script: str, argv: list, deps=(), cwd: str = "", weight: int = 0):
+        self.name = name
+        self.stage = stage
+        self.script = script
+        self.argv = argv
+        self.deps = set(deps)
+        self.cwd = cwd
+        self.weight = weight
+        self.seconds = 0.0
+
+
+def is_agency_export(path: str) -> bool:
+    """Header holds most of the agency export columns csv_to_csv maps (schema.SOURCE_TO_TARGET)."""
+    try:
+        with open_input(path, "r", encoding="utf-8-sig", errors="replace") as f:
+            header = f.readline()
+    except OSError:
+        return False
+    found = {source_name(h.strip().strip('"')) for h in re.split(r"[;,\t|]", header)} - {None}
+    return len(found) > len(SOURCE_TO_TARGET) // 2
+
+
+def source_kind(path: str) -> str:
+    kind = CONVERTERS.get(os.path.splitext(strip_compression_ext(path))[1].lower(), "")
+    if kind == "csv_to_csv" and not is_agency_export(path):
+        return ""
+    return kind
+
+
+def discover(paths: list, skip=()) -> list:
+    """(path, converter) for every source under paths; a directory holding .xlsx files is one xls_to_csv source.
+
+    Paths in skip (files, or directories with everything below them) are
+    left out, so pipeline outputs lying next to the sources are not re-ingested.
+    """
+    skip = [os.path.abspath(p) for p in skip if p]
+
+    def skipped(p: str) -> bool:
+        p = os.path.abspath(p)
+        return any(p == s or p.startswith(s + os.sep) for s in skip)
+
+    sources = []
+    for path in paths:
+        if os.path.isfile(path):
+            if skipped(path):
+                continue
+            if not source_kind(path):
+                raise SystemExit(f"unknown source format: {path}")
+            sources.append((path, source_kind(path)))
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not skipped(os.path.join(root, d)))
+            files = [f for f in sorted(files) if not skipped(os.path.join(root, f))]
+            if any(f.lower().endswith(".xlsx") for f in files):
+                sources.append((root, "xls_to_csv"))
+            sources.extend((os.path.join(root, f), kind) for f in files
+                           for kind in [source_kind(os.path.join(root, f))] if kind)
+    return sources
+
+
+def source_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path) if f.lower().endswith(".xlsx"))
+
+
+def chain_tasks(path: str, converter: str, stem: str, work_dir: str, tz_map: str):
+    """convert -> csv_normilize -> change_lang -> timezone_to_utc for one source; returns (tasks, final output)."""
+    weight = source_size(path)
+    out = os.path.join(work_dir, stem)
+    if converter == "xls_to_csv":
+        # xls_to_csv always reads ./unzipped_xlsx, so it runs in a directory linking there
+        os.makedirs(out, exist_ok=True)
+        link = os.path.join(out, XLSX_DIR)
+        if os.path.islink(link) and os.readlink(link) != os.path.abspath(path):
+            os.remove(link)
+        if not os.path.lexists(link):
+            os.symlink(os.path.abspath(path), link)
+        convert = Task(f"{stem}:convert", "convert", converter, [], cwd=out, weight=weight)
+        converted = os.path.join(out, XLSX_OUTPUT)
+    else:
+        converted = out + ".csv"
+        convert = Task(f"{stem}:convert", "convert", converter, [path, converted], weight=weight)
+    normalize = Task(f"{stem}:normalize", "normalize", "csv_normilize",
+                     [converted, "-o", out + "_normalized.csv"], [convert.name], weight=weight)
+    translit = Task(f"{stem}:translit", "translit", "change_lang",
+                    [out + "_normalized.csv", "-o", out + "_translit.csv"], [normalize.name], weight=weight)
+    utc = Task(f"{stem}:utc", "utc", "timezone_to_utc",
+               [out + "_translit.csv", tz_map, out + "_utc.csv"], [translit.name], weight=weight)
+    return [convert, normalize, translit, utc], out + "_utc.csv"
+
+
+def build_dag(sources: list, work_dir: str, tz_map: str, output: str, merge_args: list):
+    tasks, merged_inputs, stems = [], [], Counter()
+    for path, converter in sources:
+        stem = os.path.basename(os.path.normpath(strip_compression_ext(path))).replace(".", "_")
+        stems[stem] += 1
+        if stems[stem] > 1:
+            stem = f"{stem}_{stems[stem]}"
+        chain, final = chain_tasks(path, converter, stem, work_dir, tz_map)
+        tasks.extend(chain)
+        merged_inputs.append(final)
+    if output:
+        tasks.append(Task("merge", "merge", "merge_flights", merged_inputs + ["--output", output] + merge_args,
+                          [t.name for t in tasks if t.stage == "utc"]))
+    return tasks
+
+
+def run_dag(tasks: list, execute, workers: int, limits: dict):
+    """Run tasks as their dependencies finish, at most workers at once and limits[stage] per stage.
+
+    Ready tasks of the largest sources go first, so the longest chains start
+    early and the wall time tends towards the slowest chain. A failed task
+    skips everything that depends on it. Returns the names of failed tasks.
+    """
+    def guarded(task: Task) -> bool:
+        try:
+            return execute(task)
+        except BaseException as e:  # argparse's SystemExit, OSError, a corrupt cache entry, ...
+            print(f"FAIL {task.name}: {type(e).__name__}: {e}")
+            return False
+
+    pending = {t.name: t for t in tasks}
+    done, failed = set(), set()
+    running = {}
+    active = Counter()
+    with ThreadPoolExecutor(workers) as pool:
+        while pending or running:
+            blocked = [t for t in pending.values() if t.deps & failed]
+            while blocked:
+                for t in blocked:
+                    print(f"skip {t.name}: a dependency failed")
+                    del pending[t.name]
+                    failed.add(t.name)
+                blocked = [t for t in pending.values() if t.deps & failed]
+            ready = sorted((t for t in pending.values() if t.deps <= done), key=lambda t: -t.weight)
+            for t in ready:
+                if len(running) >= workers:
+                    break
+                if active[t.stage] >= limits.get(t.stage, workers):
+                    continue
+                del pending[t.name]
+                active[t.stage] += 1
+                running[pool.submit(guarded, t)] = t
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                t = running.pop(future)
+                active[t.stage] -= 1
+                (done if future.result() else failed).add(t.name)
+    return failed | set(pending)
+
+
+def chain_seconds(tasks: list) -> dict:
+    per_source = Counter()
+    for t in tasks:
+        if t.stage != "merge":
+            per_source[t.name.rsplit(":", 1)[0]] += t.seconds
+    return per_source
+
+
+def parse_limits(values: list) -> dict:
+    limits = {}
+    for value in values:
+        stage, _, n = value.partition("=")
+        if stage not in STAGES or not n.isdigit() or int(n) < 1:
+            raise SystemExit(f"bad --limit {value!r}: use STAGE=N with STAGE one of {', '.join(STAGES)}")
+        limits[stage] = int(n)
+    return limits
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Convert, normalize, transliterate and UTC-convert every source concurrently, then merge.")
+    ap.add_argument("sources", nargs="+", help="Source files or directories to scan (a directory of .xlsx "
+                                               "files is one source).")
+    ap.add_argument("--output", "-o", default=DEFAULT_OUTPUT, help="merge_flights output.")
+    ap.add_argument("--no-merge", action="store_true", help="Stop after the per-source chains.")
+    ap.add_argument("--merge-args", default="", help="Extra merge_flights options, e.g. \"--fuzzy-names\".")
+    ap.add_argument("--work-dir", default=WORK_DIR, help="Directory for intermediate files.")
+    ap.add_argument("--tz-map", default=DEFAULT_TZ_MAP)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Scripts running at once.")
+    ap.add_argument("--limit", action="append", default=[], metavar="STAGE=N",
+                    help=f"Scripts of one stage running at once ({', '.join(STAGES)}); repeatable.")
+    ap.add_argument("--cache-dir", default=CACHE_DIR)
+    ap.add_argument("--rehash", action="store_true", help="Re-read every input instead of trusting size and mtime.")
+    args = ap.parse_args()
+
+    limits = parse_limits(args.limit)
+    merge_outputs = [] if args.no_merge else [args.output]
+    sources = discover(args.sources, skip=[args.work_dir, args.cache_dir, args.tz_map] + merge_outputs)
+    if not sources:
+        raise SystemExit("no sources found")
+    os.makedirs(args.work_dir, exist_ok=True)
+    tasks = build_dag(sources, args.work_dir, args.tz_map, "" if args.no_merge else args.output,
+                      shlex.split(args.merge_args))
+    print(f"Sources: {len(sources)}, steps: {len(tasks)}, workers: {args.workers}")
+
+    cache = BuildCache(args.cache_dir, args.rehash)
+
+    def execute(task: Task) -> bool:
+        started = time.perf_counter()
+        if task.script == "merge_flights":
+            proc = subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, "merge_flights.py"), *task.argv])
+            ok = proc.returncode == 0
+            print(f"{'run ' if ok else 'FAIL'} merge_flights -> {args.output} ({time.perf_counter() - started:.1f}s)")
+        else:
+            ok = cache.run(task.script, task.argv, task.cwd)
+        task.seconds = time.perf_counter() - started
+        return ok
+
+    started = time.perf_counter()
+    try:
+        failed = run_dag(tasks, execute, max(args.workers, 1), limits)
+    finally:
+        cache.save()
+    wall = time.perf_counter() - started
+
+    cache.report()
+    per_source = chain_seconds(tasks)
+    slowest = max(per_source, key=per_source.get)
+    print(f"Wall time: {wall:.1f}s; slowest source {slowest}: {per_source[slowest]:.1f}s; "
+          f"all steps one after another: {sum(t.seconds for t in tasks):.1f}s")
+    if failed:
+        print(f"Failed or skipped: {', '.join(sorted(failed))}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,8 @@ import re
 import ijson
 import orjson
 
+from table_io import TableWriter, open_input, strip_compression_ext
+
 ALNUM_RE = re.compile(r"[^A-Za-z0-9]")
 
 COLUMNS = [
@@ -91,7 +93,7 @@ def build_loyalty_pairs(profile: dict) -> tuple[str, int]:
     return ("|".join(pairs), len(pairs))
 
 
-def process_profile(profile: dict, writer: csv.DictWriter, p_source: str):
+def process_profile(profile: dict, writer: TableWriter, p_source: str):
     real_first = extract(profile, "Real Name", "First Name")
     real_last = extract(profile, "Real Name", "Last Name")
     nickname = extract(profile, "NickName")
@@ -141,14 +143,11 @@ def parse_args():
 
 def main():
     args = parse_args()
-    p_source = args.p_source.strip() or os.path.splitext(os.path.basename(args.input_json))[0]
-
-    with open(args.output_csv, "w", newline="", encoding="utf-8", buffering=1024 * 1024) as fout:
-        writer = csv.DictWriter(
-            fout, fieldnames=COLUMNS, delimiter=";", lineterminator="\n", quoting=csv.QUOTE_MINIMAL
-        )
-        writer.writeheader()
-        with open(args.input_json, "rb") as fin:
+    p_source = args.p_source.strip() or os.path.splitext(os.path.basename(strip_compression_ext(args.input_json)))[0]
+
+    with TableWriter(args.output_csv, COLUMNS, lineterminator="\n", buffering=1024 * 1024,
+                     quoting=csv.QUOTE_MINIMAL) as writer:
+        with open_input(args.input_json) as fin:
             for prof in ijson.items(fin, "Forum Profiles.item"):
                 if isinstance(prof, dict):
                     process_profile(prof, writer, p_source)
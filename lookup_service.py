@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from table_io import read_frame
+
+# query parameter -> indexed column; loyalty is indexed per "|"-separated token
+KEY_COLUMNS = {"e_ticket": "e_ticket", "e_code": "e_code", "docs": "docs"}
+PERSON_COLUMNS = ("real_first_name", "real_last_name", "birth_date")
+PERSON_PARAMS = ("first", "last", "birth_date")
+LATENCY_WINDOW = 10000
+MAX_ROWS = 1000
+POLL_SECONDS = 2.0
+
+
+def person_key(first: str, last: str, birth: str) -> str:
+    return f"{first.strip().upper()}|{last.strip().upper()}|{birth.strip()}"
+
+
+def _index(values: pd.Series, positions=None):
+    """value -> row positions, skipping empty values.
+
+    Kept as (value -> group, group offsets, positions sorted by group) so
+    building it needs no per-group arrays.
+    """
+    keep = (values != "").to_numpy()
+    positions = np.flatnonzero(keep) if positions is None else positions[keep]
+    codes, uniques = pd.factorize(values[keep])
+    order = np.argsort(codes, kind="stable")
+    offsets = np.r_[0, np.cumsum(np.bincount(codes, minlength=len(uniques)))]
+    return dict(zip(uniques.tolist(), range(len(uniques)))), offsets, positions[order]
+
+
+def _probe(index, value: str) -> np.ndarray:
+    groups, offsets, positions = index
+    group = groups.get(value)
+    if group is None:
+        return positions[:0]
+    return positions[offsets[group]:offsets[group + 1]]
+
+
+def build_indexes(df: pd.DataFrame) -> dict:
+    indexes = {param: _index(df[col].str.strip()) for param, col in KEY_COLUMNS.items()}
+    tokens = df["loyalty_pairs"].str.split("|").explode().str.strip().fillna("")
+    indexes["loyalty"] = _index(tokens.reset_index(drop=True), tokens.index.to_numpy())
+    first, last, birth = (df[c].str.strip() for c in PERSON_COLUMNS)
+    complete = (first != "") & (last != "") & (birth != "")
+    person = (first.str.upper() + "|" + last.str.upper() + "|" + birth).where(complete, "")
+    indexes["person"] = _index(person)
+    return indexes
+
+
+class Dataset:
+    """Loaded merged table plus its hash indexes; replaced as a whole on reload."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stamp = self._stamp(path)
+        started = time.perf_counter()
+        self.df = read_frame(path).reset_index(drop=True)
+        self.indexes = build_indexes(self.df)
+        self.columns = list(self.df.columns)
+        self.rows = list(zip(*(self.df[c].tolist() for c in self.columns)))
+        self.load_seconds = time.perf_counter() - started
+
+    @staticmethod
+    def _stamp(path: str):
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def changed(self) -> bool:
+        try:
+            return self._stamp(self.path) != self.stamp
+        except FileNotFoundError:
+            return False
+
+    def lookup(self, query: dict, limit: int = MAX_ROWS):
+        """Rows matching every given key (intersection), as a list of dicts.
+
+        A person is looked up by first, last and birth_date together; ValueError
+        when only some of them are given.
+        """
+        if any(k in query for k in PERSON_PARAMS):
+            parts = [query.get(k, "").strip() for k in PERSON_PARAMS]
+            if not all(parts):
+                raise ValueError("first, last and birth_date must be given together")
+            query = {k: v for k, v in query.items() if k not in PERSON_PARAMS}
+            query["person"] = person_key(*parts)
+        hits = None
+        for param, value in query.items():
+            index = self.indexes.get(param)
+            if index is None:
+                raise KeyError(param)
+            rows = _probe(index, value if param == "person" else value.strip())
+            hits = rows if hits is None else np.intersect1d(hits, rows)
+        if hits is None:
+            return 0, []
+        return len(hits), [dict(zip(self.columns, self.rows[i])) for i in np.sort(hits)[:limit].tolist()]
+
+
+class LookupService:
+    def __init__(self, path: str, max_rows: int = MAX_ROWS, poll: float = POLL_SECONDS):
+        self.path = path
+        self.max_rows = max_rows
+        self.poll = poll
+        self.data = Dataset(path)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.reloads = 0
+
+    async def watch(self):
+        """Reload in a worker thread when the file changes; queries keep using the old data meanwhile."""
+        while True:
+            await asyncio.sleep(self.poll)
+            if self.data.changed():
+                try:
+                    self.data = await asyncio.to_thread(Dataset, self.path)
+                    self.reloads += 1
+                    print(f"reloaded {self.path}: {len(self.data.df)} rows in {self.data.load_seconds:.2f}s")
+                except Exception as e:  # a half-written file; retry on the next poll
+                    print(f"reload failed: {e}")
+
+    def stats(self) -> dict:
+        lat = np.fromiter(self.latencies, dtype=float) * 1000
+        pct = dict(zip(("p50_ms", "p90_ms", "p99_ms"), np.percentile(lat, [50, 90, 99]).round(3).tolist())) \
+            if len(lat) else {}
+        return {"rows": len(self.data.df), "requests": self.requests, "reloads": self.reloads,
+                "load_seconds": round(self.data.load_seconds, 3), **pct}
+
+    def handle(self, target: str):
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query))
+        if url.path == "/lookup":
+            try:
+                count, rows = self.data.lookup(query, self.max_rows)
+            except KeyError as e:
+                return 400, {"error": f"unknown key {e.args[0]}"}
+            except ValueError as e:
+                return 400, {"error": str(e)}
+            return 200, {"count": count, "rows": rows}
+        if url.path == "/stats":
+            return 200, self.stats()
+        return 404, {"error": "use /lookup or /stats"}
+
+    async def serve_client(self, reader, writer):
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                started = time.perf_counter()
+                parts = request.decode("utf-8", "replace").split()
+                status, body = self.handle(parts[1]) if len(parts) >= 2 and parts[0] == "GET" \
+                    else (405, {"error": "GET only"})
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                             f"Content-Type: application/json; charset=utf-8\r\n"
+                             f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload)
+                await writer.drain()
+                self.requests += 1
+                self.latencies.append(time.perf_counter() - started)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service: LookupService, host: str, port: int, unix: str = ""):
+    if unix:
+        server = await asyncio.start_unix_server(service.serve_client, unix)
+        where = unix
+    else:
+        server = await asyncio.start_server(service.serve_client, host, port)
+        where = f"http://{host}:{port}"
+    print(f"{len(service.data.df)} rows indexed in {service.data.load_seconds:.2f}s; listening on {where}")
+    async with server:
+        await asyncio.gather(server.serve_forever(), service.watch())
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local point-lookup service over merge_flights output.")
+    ap.add_argument("merged", help="merge_flights output (.csv, .parquet or .arrow); reloaded when it changes.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--unix", default="", help="Listen on this Unix socket instead of TCP.")
+    ap.add_argument("--max-rows", type=int, default=MAX_ROWS, help="Rows returned per lookup at most.")
+    ap.add_argument("--poll", type=float, default=POLL_SECONDS, help="Seconds between file change checks.")
+    args = ap.parse_args()
+
+    service = LookupService(args.merged, args.max_rows, args.poll)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,45 @@
 # -*- coding: utf-8 -*-
 import argparse
 import itertools
-from collections import defaultdict
-from typing import List, Tuple, Dict, Set
-
+import os
+import pickle
+import signal
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import List, Tuple, Dict, Set, FrozenSet
+
+import numpy as np
 import pandas as pd
 
-REQUIRED_COLS = [
-    "real_first_name","real_last_name","birth_date",
-    "flight_date","flight_time","flight_no","codeshare",
-    "dep_city","dep_airport","arr_city","arr_airport",
-    "e_code","e_ticket","docs","seat","meal",
-    "booking_class","fare_basis","baggage","loyalty_pairs",
-]
-OUTPUT_COLS = REQUIRED_COLS[:]
-
+from name_match import lsh_bands, names_similar
+from schema import TARGET_COLUMNS as REQUIRED_COLS, clean_header_name, is_loyalty_card, synonym_name
+from table_io import is_columnar, read_frame, table_columns, write_frame
 
-SYNONYMS = {
-    "dep-airport": "dep_airport",
-    "dep airport": "dep_airport",
-    "dep_air":     "dep_airport",
-    "arr-airport": "arr_airport",
-    "arr airport": "arr_airport",
-    "arr_air":     "arr_airport",
-    "flight time": "flight_time",
-    "flight date": "flight_date",
-    "flight no":   "flight_no",
-    "loyalty":     "loyalty_pairs",
-    "loyaltypair": "loyalty_pairs",
-    "e-ticket":    "e_ticket",
-    "e ticket":    "e_ticket",
-    "e_code ":     "e_code",
-    "fare":        "fare_basis",
+OUTPUT_COLS = REQUIRED_COLS[:]
+CHECKPOINT_EVERY = 300.0
+PROGRESS_EVERY = 2.0
+# how many pairs are verified between clock checks
+TICK_PAIRS = 256
+# --plan: key columns of the single-value bucket families, as in build_buckets
+BUCKET_COLUMNS = {
+    "B1": ("flight_date", "flight_no", "dep_airport", "arr_airport"),
+    "B2": ("flight_date", "flight_no", "booking_class"),
+    "B3": ("e_ticket",),
+    "B4": ("e_code",),
+    "B5": ("docs",),
 }
-
-def clean_header_name(name: str) -> str:
-    if name is None:
-        return ""
-    s = (str(name)
-         .replace("\ufeff", "")
-         .replace("\xa0", " ")
-         .strip())
-    s = "_".join(s.lower().replace("-", " ").split())
-    if s in SYNONYMS:
-        s = SYNONYMS[s]
-    return s
+# measured CPython sizes: candidate set plus its sorted list per pair, bucket dict key, list slot
+PAIR_BYTES = 154
+BUCKET_KEY_BYTES = 320
+BUCKET_ENTRY_BYTES = 9
+CALIBRATION_PAIRS = 2000
+HEAVY_KEYS = 10
+# --tune-pairs/--tune-seconds: per-family limits tried, and verified pairs per family for the yield model
+TUNE_BUCKET_MAX = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+TUNE_WINDOWS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 24, 32)
+TUNE_SAMPLE_PAIRS = 400
+TUNE_SN_BUCKETS = 20
 
 def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     df = df.loc[:, [c for c in df.columns if str(c).strip() != ""]]
@@ -68,14 +63,7 @@ def eq_wild(a: str, b: str) -> bool:
 def parse_loyalty_set(s: str) -> Set[str]:
     s = norm(s)
     if s == "": return set()
-    parts = [p.strip() for p in s.split("|") if p.strip() != ""]
-    return set(parts)
-
-def loyalty_equal(s1: str, s2: str) -> bool:
-    A = parse_loyalty_set(s1); B = parse_loyalty_set(s2)
-    if len(A) == 0 or len(B) == 0:
-        return True
-    return len(A & B) > 0
+    return {p for p in (p.strip() for p in s.split("|")) if is_loyalty_card(p)}
 
 def loyalty_union(*values: List[str]) -> str:
     uni = set()
@@ -83,17 +71,42 @@ def loyalty_union(*values: List[str]) -> str:
         uni |= parse_loyalty_set(v)
     return "|".join(sorted(uni)) if uni else ""
 
+def intern_loyalty(values) -> Tuple[List[FrozenSet[int]], List[str]]:
+    """Token-id set per row plus the id -> token list; each distinct string is parsed once."""
+    token_ids: Dict[str, int] = {}
+    parsed: Dict[str, FrozenSet[int]] = {}
+    rows = []
+    for v in values:
+        ids = parsed.get(v)
+        if ids is None:
+            ids = frozenset(token_ids.setdefault(t, len(token_ids)) for t in parse_loyalty_set(v))
+            parsed[v] = ids
+        rows.append(ids)
+    return rows, list(token_ids)
+
+def loyalty_ids_of(r: Dict) -> FrozenSet:
+    ids = r.get("loyalty_ids")
+    return ids if ids is not None else frozenset(parse_loyalty_set(r["loyalty_pairs"]))
+
+def loyalty_ids_equal(a: FrozenSet, b: FrozenSet) -> bool:
+    return not a or not b or not a.isdisjoint(b)
+
+def loyalty_ids_union(id_sets: List[FrozenSet[int]], vocab: List[str]) -> str:
+    uni = frozenset().union(*id_sets)
+    return "|".join(sorted(vocab[t] for t in uni)) if uni else ""
 
-def passenger_equal(r1: Dict[str, str], r2: Dict[str, str]) -> bool:
+
+def passenger_equal(r1: Dict[str, str], r2: Dict[str, str], fuzzy: bool = False) -> bool:
+    name_eq = names_similar if fuzzy else eq_wild
     return (
-        eq_wild(r1["real_first_name"], r2["real_first_name"]) and
-        eq_wild(r1["real_last_name"],  r2["real_last_name"])  and
+        name_eq(r1["real_first_name"], r2["real_first_name"]) and
+        name_eq(r1["real_last_name"],  r2["real_last_name"])  and
         eq_wild(r1["birth_date"],      r2["birth_date"])      and
         eq_wild(r1["docs"],            r2["docs"])            and
         eq_wild(r1["e_code"],          r2["e_code"])          and
         eq_wild(r1["e_ticket"],        r2["e_ticket"])        and
         eq_wild(r1["fare_basis"],      r2["fare_basis"])      and
-        loyalty_equal(r1["loyalty_pairs"], r2["loyalty_pairs"])
+        loyalty_ids_equal(loyalty_ids_of(r1), loyalty_ids_of(r2))
     )
 
 def flight_equal(r1: Dict[str, str], r2: Dict[str, str]) -> bool:
@@ -106,8 +119,8 @@ def flight_equal(r1: Dict[str, str], r2: Dict[str, str]) -> bool:
         eq_wild(r1["booking_class"], r2["booking_class"])
     )
 
-def is_duplicate(r1: Dict[str, str], r2: Dict[str, str]) -> bool:
-    return passenger_equal(r1, r2) and flight_equal(r1, r2)
+def is_duplicate(r1: Dict[str, str], r2: Dict[str, str], fuzzy: bool = False) -> bool:
+    return passenger_equal(r1, r2, fuzzy) and flight_equal(r1, r2)
 
 
 class DSU:
@@ -136,7 +149,43 @@ def add_bucket(buckets: Dict[Tuple, List[int]], key_tuple: Tuple, idx: int):
         return
     buckets[key_tuple].append(idx)
 
-def build_buckets(df: pd.DataFrame) -> Dict[str, Dict[Tuple, List[int]]]:
+def has_bucket_key(df: pd.DataFrame, loyalty_ids: List[FrozenSet[int]], fuzzy: bool = False) -> np.ndarray:
+    """Rows that land in at least one bucket of build_buckets."""
+    keyed = np.fromiter((len(ids) > 0 for ids in loyalty_ids), dtype=bool, count=len(df))
+    for cols in BUCKET_COLUMNS.values():
+        keyed |= (df[list(cols)] != "").all(axis=1).to_numpy()
+    if fuzzy:
+        named = np.fromiter((bool(lsh_bands(f, l)) for f, l in zip(df["real_first_name"], df["real_last_name"])),
+                            dtype=bool, count=len(df))
+        keyed |= named & (df["flight_date"] != "").to_numpy()
+    return keyed
+
+def collapse_exact_duplicates(df: pd.DataFrame, loyalty_ids: List[FrozenSet[int]],
+                              fuzzy: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """Group rows identical across REQUIRED_COLS: (group per row, first row of each group).
+
+    Rows are grouped by a 64-bit FNV-style hash over their per-column
+    factorize codes, checked against the codes themselves. Identical rows
+    always pass is_duplicate, so a group stands for its members wherever
+    they share a bucket. Rows with no bucket key are never compared and
+    stay single. Groups are numbered in order of first appearance.
+    """
+    n = len(df)
+    codes = np.stack([pd.factorize(df[c])[0] for c in REQUIRED_COLS]).astype(np.uint64)
+    h = np.full(n, 0xCBF29CE484222325, dtype=np.uint64)
+    for col in codes:
+        h = (h ^ col) * np.uint64(0x100000001B3)
+    group, _ = pd.factorize(h)
+    _, first = np.unique(group, return_index=True)
+    if not (codes == codes[:, first[group]]).all():  # hash collision
+        group = df.groupby(REQUIRED_COLS, sort=False).ngroup().to_numpy()
+    group = np.where(has_bucket_key(df, loyalty_ids, fuzzy), group, -1 - np.arange(n))
+    group, _ = pd.factorize(group)
+    _, reps = np.unique(group, return_index=True)
+    return group, reps
+
+def build_buckets(df: pd.DataFrame, fuzzy: bool = False,
+                  loyalty_ids: List[FrozenSet[int]] = None) -> Dict[str, Dict[Tuple, List[int]]]:
     B = {
         "B1": defaultdict(list),  # (flight_date, flight_no, dep_airport, arr_airport)
         "B2": defaultdict(list),  # (flight_date, flight_no, booking_class)
@@ -145,6 +194,8 @@ def build_buckets(df: pd.DataFrame) -> Dict[str, Dict[Tuple, List[int]]]:
         "B5": defaultdict(list),  # (docs,)
         "B6": defaultdict(list),  # (loyalty_pair,)
     }
+    if fuzzy:
+        B["B7"] = defaultdict(list)  # (flight_date, name LSH band)
 
     n = len(df)
     for i in range(n):
@@ -153,9 +204,12 @@ def build_buckets(df: pd.DataFrame) -> Dict[str, Dict[Tuple, List[int]]]:
         add_bucket(B["B3"], (df.at[i,"e_ticket"],), i)
         add_bucket(B["B4"], (df.at[i,"e_code"],), i)
         add_bucket(B["B5"], (df.at[i,"docs"],), i)
-        loy = parse_loyalty_set(df.at[i,"loyalty_pairs"])
+        loy = loyalty_ids[i] if loyalty_ids is not None else parse_loyalty_set(df.at[i,"loyalty_pairs"])
         for token in loy:
             add_bucket(B["B6"], (token,), i)
+        if fuzzy:
+            for band in lsh_bands(df.at[i,"real_first_name"], df.at[i,"real_last_name"]):
+                add_bucket(B["B7"], (df.at[i,"flight_date"], band), i)
     return B
 
 def sorted_neighborhood_pairs(indices: List[int],
@@ -171,46 +225,287 @@ def sorted_neighborhood_pairs(indices: List[int],
             out_pairs.append((min(a, b), max(a, b)))
     return out_pairs
 
+def neighborhood_key(df: pd.DataFrame, i: int) -> Tuple:
+    return (
+        norm(df.at[i,"real_last_name"]),
+        norm(df.at[i,"real_first_name"]),
+        norm(df.at[i,"birth_date"]),
+        norm(df.at[i,"docs"]),
+        norm(df.at[i,"e_ticket"]),
+        norm(df.at[i,"e_code"]),
+        norm(df.at[i,"fare_basis"]),
+    )
+
 def generate_candidate_pairs(df: pd.DataFrame,
                              buckets: Dict[str, Dict[Tuple, List[int]]],
                              bucket_max: int = 200,
-                             window: int = 8) -> Set[Tuple[int, int]]:
+                             window: int = 8,
+                             limits: Dict[str, Tuple[int, int]] = None) -> Set[Tuple[int, int]]:
+    """limits: optional family -> (bucket_max, window) overriding the defaults, see tune_limits."""
     candidates: Set[Tuple[int, int]] = set()
 
-    def sort_key(i: int) -> Tuple:
-        return (
-            norm(df.at[i,"real_last_name"]),
-            norm(df.at[i,"real_first_name"]),
-            norm(df.at[i,"birth_date"]),
-            norm(df.at[i,"docs"]),
-            norm(df.at[i,"e_ticket"]),
-            norm(df.at[i,"e_code"]),
-            norm(df.at[i,"fare_basis"]),
-        )
-
-    for _, bdict in buckets.items():
+    for name, bdict in buckets.items():
+        bmax, win = (limits or {}).get(name, (bucket_max, window))
         for _, idxs in bdict.items():
             if len(idxs) <= 1:
                 continue
-            if len(idxs) <= bucket_max:
+            if len(idxs) <= bmax:
                 for a, b in itertools.combinations(sorted(idxs), 2):
                     candidates.add((a, b))
             else:
-                keys = [sort_key(i) for i in idxs]
-                for a, b in sorted_neighborhood_pairs(idxs, keys, window):
+                keys = [neighborhood_key(df, i) for i in idxs]
+                for a, b in sorted_neighborhood_pairs(idxs, keys, win):
                     candidates.add((a, b))
     return candidates
 
+def bucket_sizes(df: pd.DataFrame, loyalty: Tuple[List[FrozenSet[int]], List[str]],
+                 fuzzy: bool = False) -> Dict[str, pd.Series]:
+    """Size of every bucket build_buckets would make, per family, without building them."""
+    sizes = {}
+    for name, cols in BUCKET_COLUMNS.items():
+        keys = df.loc[(df[list(cols)] != "").all(axis=1).to_numpy(), list(cols)]
+        sizes[name] = keys.value_counts(sort=False)
+    id_sets, vocab = loyalty
+    tokens = np.fromiter((t for ids in id_sets for t in ids), dtype=np.int64)
+    counts = np.bincount(tokens, minlength=len(vocab))
+    sizes["B6"] = pd.Series(counts, index=pd.Index(vocab, dtype=object))[counts > 0]
+    if fuzzy:
+        bands = Counter()
+        for date, first, last in zip(df["flight_date"], df["real_first_name"], df["real_last_name"]):
+            if date != "":
+                bands.update((date, f"band{b}:{sig.hex()}") for b, sig in lsh_bands(first, last))
+        sizes["B7"] = pd.Series(bands, dtype=np.int64)
+    return sizes
+
+def bucket_pairs(sizes: np.ndarray, bucket_max: int, window: int) -> np.ndarray:
+    """Pairs generate_candidate_pairs emits per bucket: all of them up to bucket_max, else window neighbours."""
+    n = np.asarray(sizes, dtype=np.int64)
+    w = max(window, 0)
+    neighborhood = np.where(n > w, w * (n - w) + w * (w - 1) // 2, n * (n - 1) // 2)
+    return np.where(n <= 1, 0, np.where(n <= bucket_max, n * (n - 1) // 2, neighborhood))
+
+def calibrate_rate(df: pd.DataFrame, loyalty_ids: List[FrozenSet[int]], fuzzy: bool = False,
+                   sample: int = CALIBRATION_PAIRS) -> float:
+    """Verified pairs per second on random row pairs, through the same row_dict/is_duplicate path."""
+    if len(df) < 2:
+        return 0.0
+    rng = np.random.default_rng(0)
+    pairs = rng.integers(0, len(df), size=(sample, 2)).tolist()
+    started = time.perf_counter()
+    for a, b in pairs:
+        is_duplicate(row_dict(df, loyalty_ids, a), row_dict(df, loyalty_ids, b), fuzzy)
+    return sample / (time.perf_counter() - started)
+
+def print_plan(df: pd.DataFrame, loyalty: Tuple[List[FrozenSet[int]], List[str]],
+               bucket_max: int, window: int, fuzzy: bool = False):
+    sizes = bucket_sizes(df, loyalty, fuzzy)
+    print(f"Plan for {len(df)} rows, bucket_max={bucket_max}, window={window}")
+    print(f"{'family':<7}{'keys':>10}{'rows':>12}{'max':>9}{'oversized':>10}{'combinations':>16}{'neighborhood':>16}")
+    total_pairs = total_keys = total_entries = 0
+    heavy = []
+    for name, s in sizes.items():
+        n = s.to_numpy(dtype=np.int64)
+        pairs = bucket_pairs(n, bucket_max, window)
+        big = n > bucket_max
+        print(f"{name:<7}{len(n):>10}{int(n.sum()):>12}{int(n.max()) if len(n) else 0:>9}{int(big.sum()):>10}"
+              f"{int(pairs[~big].sum()):>16,}{int(pairs[big].sum()):>16,}")
+        total_pairs += int(pairs.sum())
+        total_keys += len(n)
+        total_entries += int(n.sum())
+        for k in np.argsort(-pairs, kind="stable")[:HEAVY_KEYS]:
+            if pairs[k]:
+                key = s.index[k]
+                heavy.append((int(pairs[k]), name, "/".join(map(str, key)) if isinstance(key, tuple) else str(key), int(n[k])))
+    hist = np.concatenate([s.to_numpy(dtype=np.int64) for s in sizes.values()] or [np.zeros(0, dtype=np.int64)])
+    edges = sorted({2, 3, 11, 101, 1001, bucket_max + 1})
+    counts = np.bincount(np.searchsorted(edges, hist[hist >= 2], side="right") - 1, minlength=len(edges))
+    labels = [f"{lo}-{hi - 1}" if hi - 1 > lo else str(lo) for lo, hi in zip(edges, edges[1:])] + [f"{edges[-1]}+"]
+    print("buckets by size: " + ", ".join(f"{label}: {c}" for label, c in zip(labels, counts)))
+    print(f"pairs to check: at most {total_pairs:,} (a pair found by several families is checked once)")
+
+    row_bytes = int(df.memory_usage(deep=True).sum()) + 28 * len(df)
+    bucket_bytes = total_keys * BUCKET_KEY_BYTES + total_entries * BUCKET_ENTRY_BYTES
+    pair_bytes = total_pairs * PAIR_BYTES
+    mb = 1 << 20
+    print(f"memory: ~{(row_bytes + bucket_bytes + pair_bytes) / mb:,.0f} MB "
+          f"(rows {row_bytes / mb:,.0f}, buckets {bucket_bytes / mb:,.0f}, candidate pairs {pair_bytes / mb:,.0f})")
+    rate = calibrate_rate(df, loyalty[0], fuzzy)
+    print(f"verification: {rate:,.0f} pairs/s measured on {CALIBRATION_PAIRS} sample pairs, "
+          f"about {format_eta(total_pairs / rate if rate else float('inf'))}")
+    print("heaviest keys:")
+    for pairs, name, key, size in sorted(heavy, key=lambda h: (-h[0], h[1]))[:HEAVY_KEYS]:
+        print(f"  {name} {key}: {size} rows, {pairs:,} pairs")
+
+def _log2_class(n: np.ndarray) -> np.ndarray:
+    return np.floor(np.log2(np.maximum(n, 1))).astype(np.int64)
+
+def _fill_yields(hits: np.ndarray, tries: np.ndarray) -> np.ndarray:
+    """Duplicate share per class; classes without samples take the nearest sampled one."""
+    y = pd.Series(np.where(tries > 0, hits / np.maximum(tries, 1), np.nan))
+    return y.ffill().bfill().fillna(0.0).to_numpy()
+
+def duplicate_yields(df: pd.DataFrame, loyalty_ids: List[FrozenSet[int]],
+                     bdict: Dict[Tuple, List[int]], fuzzy: bool = False,
+                     sample: int = TUNE_SAMPLE_PAIRS, rng=None) -> Tuple[np.ndarray, np.ndarray]:
+    """Sampled duplicate share of one bucket family's pairs.
+
+    Returns (combination yield by log2(bucket size - 1) class, neighborhood
+    yield by log2(distance) class in the sorted bucket). Half the sample
+    goes to random pairs of random buckets, weighted by their pair counts;
+    the other half to pairs at a given distance in up to TUNE_SN_BUCKETS
+    buckets sorted as generate_candidate_pairs sorts them.
+    """
+    rng = rng if rng is not None else np.random.default_rng(0)
+    groups = [idxs for idxs in bdict.values() if len(idxs) > 1]
+    n_dist = int(_log2_class(np.array([max(TUNE_WINDOWS)]))[0]) + 1
+    if not groups:
+        return np.zeros(1), np.zeros(n_dist)
+
+    def dup(a: int, b: int) -> bool:
+        return is_duplicate(row_dict(df, loyalty_ids, a), row_dict(df, loyalty_ids, b), fuzzy)
+
+    sizes = np.array([len(g) for g in groups], dtype=np.int64)
+    classes = _log2_class(sizes - 1)
+    hits = np.zeros(int(classes.max()) + 1)
+    tries = np.zeros_like(hits)
+    present = np.unique(classes)
+    per_class = max(sample // 2 // len(present), 1)
+    for c in present:
+        members = np.flatnonzero(classes == c)
+        weight = (sizes[members] * (sizes[members] - 1)).astype(float)
+        for g in rng.choice(members, size=per_class, p=weight / weight.sum()):
+            a, b = rng.choice(len(groups[g]), size=2, replace=False)
+            hits[c] += dup(groups[g][a], groups[g][b])
+            tries[c] += 1
+
+    picked = rng.choice(len(groups), size=min(TUNE_SN_BUCKETS, len(groups)), replace=False,
+                        p=sizes / sizes.sum())
+    ordered = []
+    for g in picked:
+        keys = [neighborhood_key(df, i) for i in groups[g]]
+        ordered.append([i for i, _ in sorted(zip(groups[g], keys), key=lambda x: x[1])])
+    longest = max(len(o) for o in ordered)
+    sn_hits = np.zeros(n_dist)
+    sn_tries = np.zeros(n_dist)
+    per_dist = max(sample // 2 // n_dist, 1)
+    for c in range(n_dist):
+        lo, hi = 1 << c, min((1 << (c + 1)) - 1, max(TUNE_WINDOWS))
+        if lo >= longest:
+            continue
+        for _ in range(per_dist):
+            d = int(rng.integers(lo, hi + 1))
+            fits = [o for o in ordered if len(o) > d]
+            if not fits:
+                continue
+            o = fits[int(rng.integers(len(fits)))]
+            k = int(rng.integers(len(o) - d))
+            sn_hits[c] += dup(o[k], o[k + d])
+            sn_tries[c] += 1
+    return _fill_yields(hits, tries), _fill_yields(sn_hits, sn_tries)
+
+def expected_duplicates(sizes: np.ndarray, bucket_max: int, window: int,
+                        comb_yield: np.ndarray, sn_yield: np.ndarray) -> float:
+    """Expected duplicate pairs among a family's candidates for one (bucket_max, window)."""
+    n = sizes[sizes > 1]
+    all_pairs = n * (n - 1) / 2 * comb_yield[np.minimum(_log2_class(n - 1), len(comb_yield) - 1)]
+    big = n > bucket_max
+    total = float(all_pairs[~big].sum())
+    # neighbours can find no more duplicates than the whole bucket holds
+    near = np.zeros(int(big.sum()))
+    for d in range(1, window + 1):
+        near += np.maximum(n[big] - d, 0) * sn_yield[min(int(_log2_class(np.array([d]))[0]), len(sn_yield) - 1)]
+    return total + float(np.minimum(near, all_pairs[big]).sum())
+
+def tune_limits(sizes: Dict[str, np.ndarray], yields: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                budget: int) -> Tuple[Dict[str, Tuple[int, int]], Dict[str, Dict]]:
+    """Per-family (bucket_max, window) maximizing expected duplicate pairs within a pair budget.
+
+    Each family's (pairs, expected duplicates) options are reduced to their
+    upper convex hull, then the step with the most duplicates per extra pair
+    is taken until no further step fits (greedy multiple-choice knapsack).
+    """
+    hulls = {}
+    for name, n in sizes.items():
+        largest = int(n.max()) if len(n) else 1
+        grid = {(min(bm, largest), w if bm < largest else 0)
+                for bm in TUNE_BUCKET_MAX + (largest,) for w in TUNE_WINDOWS}
+        # cheapest first; for equal cost the most duplicates, then plain combinations over sorting
+        options = sorted(
+            ((int(bucket_pairs(n, bm, w).sum()), expected_duplicates(n, bm, w, *yields[name]), bm, w)
+             for bm, w in grid), key=lambda o: (o[0], -o[1], -o[2], o[3]))
+        hull = []
+        for opt in options:
+            if hull and opt[1] <= hull[-1][1]:
+                continue
+            while len(hull) >= 2 and (hull[-1][1] - hull[-2][1]) * (opt[0] - hull[-2][0]) \
+                    <= (opt[1] - hull[-2][1]) * (hull[-1][0] - hull[-2][0]):
+                hull.pop()
+            hull.append(opt)
+        hulls[name] = (hull, max(o[1] for o in options))
+
+    at = {name: 0 for name in hulls}
+    left = budget - sum(h[0][0] for h, _ in hulls.values())
+    while True:
+        steps = []
+        for name, (hull, _) in hulls.items():
+            k = at[name]
+            if k + 1 < len(hull) and hull[k + 1][0] - hull[k][0] <= left:
+                cost = hull[k + 1][0] - hull[k][0]
+                steps.append(((hull[k + 1][1] - hull[k][1]) / max(cost, 1), name, cost))
+        if not steps:
+            break
+        _, name, cost = max(steps)
+        at[name] += 1
+        left -= cost
+
+    limits, report = {}, {}
+    for name, (hull, full) in hulls.items():
+        pairs, found, bm, w = hull[at[name]]
+        limits[name] = (bm, w)
+        report[name] = {"pairs": pairs, "expected": found, "exhaustive": full}
+    return limits, report
+
+def print_tuning(limits: Dict[str, Tuple[int, int]], report: Dict[str, Dict], budget: int,
+                 default_expected: float, default_pairs: int):
+    print(f"Auto-tune for a budget of {budget:,} pairs:")
+    for name, (bm, w) in limits.items():
+        r = report[name]
+        recall = r["expected"] / r["exhaustive"] if r["exhaustive"] else 1.0
+        print(f"  {name}: bucket_max={bm} window={w}, {r['pairs']:,} pairs, "
+              f"~{r['expected']:,.0f} duplicate pairs ({100 * recall:.1f}% of exhaustive)")
+    pairs = sum(r["pairs"] for r in report.values())
+    found = sum(r["expected"] for r in report.values())
+    full = sum(r["exhaustive"] for r in report.values())
+    loss = 1 - found / full if full else 0.0
+    print(f"  total: {pairs:,} pairs, ~{found:,.0f} of ~{full:,.0f} duplicate pairs, "
+          f"estimated recall loss {100 * loss:.1f}% (defaults: {default_pairs:,} pairs, ~{default_expected:,.0f})")
+
+def auto_tune(df: pd.DataFrame, loyalty_ids: List[FrozenSet[int]], buckets: Dict[str, Dict[Tuple, List[int]]],
+              budget: int, bucket_max: int, window: int, fuzzy: bool = False) -> Dict[str, Tuple[int, int]]:
+    rng = np.random.default_rng(0)
+    sizes = {name: np.array([len(v) for v in b.values()], dtype=np.int64) for name, b in buckets.items()}
+    yields = {name: duplicate_yields(df, loyalty_ids, b, fuzzy, rng=rng) for name, b in buckets.items()}
+    limits, report = tune_limits(sizes, yields, budget)
+    default_pairs = sum(int(bucket_pairs(n, bucket_max, window).sum()) for n in sizes.values())
+    default_expected = sum(expected_duplicates(n, bucket_max, window, *yields[name]) for name, n in sizes.items())
+    print_tuning(limits, report, budget, default_expected, default_pairs)
+    return limits
+
 def pick_first_nonempty(values: List[str]) -> str:
     for v in values:
         if not empty(v):
             return norm(v)
     return ""
 
-def aggregate_cluster(df: pd.DataFrame, indices: List[int]) -> Dict[str, str]:
+def aggregate_cluster(df: pd.DataFrame, indices: List[int], loyalty=None) -> Dict[str, str]:
+    """loyalty: optional (row id sets, vocab) from intern_loyalty."""
     out = {}
     idxs = sorted(indices)
-    out["loyalty_pairs"] = loyalty_union(*[df.at[i, "loyalty_pairs"] for i in idxs])
+    if loyalty is not None:
+        id_sets, vocab = loyalty
+        out["loyalty_pairs"] = loyalty_ids_union([id_sets[i] for i in idxs], vocab)
+    else:
+        out["loyalty_pairs"] = loyalty_union(*[df.at[i, "loyalty_pairs"] for i in idxs])
     for col in OUTPUT_COLS:
         if col == "loyalty_pairs":
             continue
@@ -218,7 +513,18 @@ def aggregate_cluster(df: pd.DataFrame, indices: List[int]) -> Dict[str, str]:
         out[col] = pick_first_nonempty(vals)
     return out
 
+def read_one_columnar(path: str) -> pd.DataFrame:
+    wanted = [c for c in table_columns(path) if str(c).strip() != "" and synonym_name(c)]
+    df = normalize_columns(read_frame(path, columns=wanted))
+    missing = [c for c in REQUIRED_COLS if c not in set(df.columns)]
+    if missing:
+        raise ValueError(f"{path}: missing columns after header normalization: {missing}\n"
+                         f"Seen columns: {sorted(df.columns)}")
+    return df
+
 def read_one_strict(path: str, sep: str) -> pd.DataFrame:
+    if is_columnar(path):
+        return read_one_columnar(path)
     df = pd.read_csv(path, sep=sep, dtype=str, keep_default_na=False, engine="python", quoting=3)
     df = normalize_columns(df)
     present = set(df.columns)
@@ -239,18 +545,10 @@ def read_one_strict(path: str, sep: str) -> pd.DataFrame:
                          f"Seen columns: {sorted(present2)}")
     return df2
 
-def main():
-    ap = argparse.ArgumentParser(description="Merge flights CSVs into unique trips per passenger by strict rules.")
-    ap.add_argument("inputs", nargs="+", help="Input CSV files.")
-    ap.add_argument("--output", "-o", required=True, help="Output merged CSV path.")
-    ap.add_argument("--sep", default=";", help="Input CSV delimiter (default=';').")
-    ap.add_argument("--bucket-max", type=int, default=200, help="Max bucket size before sorted-neighborhood.")
-    ap.add_argument("--window", type=int, default=8, help="Neighborhood window size for large buckets.")
-    args = ap.parse_args()
-
+def load_inputs(paths: List[str], sep: str) -> pd.DataFrame:
     frames = []
-    for path in args.inputs:
-        df = read_one_strict(path, sep=args.sep)
+    for path in paths:
+        df = read_one_strict(path, sep=sep)
 
         df = df.reindex(columns=REQUIRED_COLS)
 
@@ -267,39 +565,193 @@ def main():
     df_all = pd.concat(frames, ignore_index=True)
     for c in REQUIRED_COLS:
         df_all[c] = df_all[c].astype(str).map(norm)
+    return df_all
+
+def row_dict(df: pd.DataFrame, loyalty_ids: List[FrozenSet[int]], i: int) -> Dict[str, str]:
+    r = {col: df.at[i, col] for col in REQUIRED_COLS}
+    r["loyalty_ids"] = loyalty_ids[i]
+    return r
+
+def save_checkpoint(path: str, state: bytes, progress: Dict):
+    """state: pickled load/bucket stage, written as is; progress: cursor and DSU arrays."""
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(state)
+        pickle.dump(progress, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+def load_checkpoint(path: str) -> Tuple[Dict, bytes, Dict]:
+    """The load/bucket stage, its pickled bytes for the next checkpoints, and the progress."""
+    with open(path, "rb") as f:
+        stage = pickle.load(f)
+        size = f.tell()
+        progress = pickle.load(f)
+        f.seek(0)
+        return stage, f.read(size), progress
+
+def format_eta(seconds: float) -> str:
+    if seconds == float("inf"):
+        return "?"
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h}:{m:02d}:{s:02d}"
+
+def report_progress(done: int, total: int, rate: float):
+    eta = (total - done) / rate if rate > 0 else float("inf")
+    print(f"\rverified {done}/{total} pairs ({100.0 * done / max(total, 1):.1f}%), "
+          f"{rate:,.0f} pairs/s, ETA {format_eta(eta)}", end="", file=sys.stderr, flush=True)
 
-    print(f"Loaded rows: {len(df_all)}")
-
-    buckets = build_buckets(df_all)
-    candidate_pairs = generate_candidate_pairs(df_all, buckets, bucket_max=args.bucket_max, window=args.window)
+def main():
+    ap = argparse.ArgumentParser(description="Merge flights CSVs into unique trips per passenger by strict rules.")
+    ap.add_argument("inputs", nargs="+", help="Input CSV/Parquet/Arrow files.")
+    ap.add_argument("--output", "-o", required=True,
+                    help="Output merged path (.csv, .parquet or .arrow).")
+    ap.add_argument("--sep", default=";", help="Input CSV delimiter (default=';').")
+    ap.add_argument("--bucket-max", type=int, default=200, help="Max bucket size before sorted-neighborhood.")
+    ap.add_argument("--window", type=int, default=8, help="Neighborhood window size for large buckets.")
+    ap.add_argument("--fuzzy-names", action="store_true",
+                    help="Also match transliteration variants and small typos in names "
+                         "(candidates come from name MinHash-LSH blocks per flight date).")
+    ap.add_argument("--checkpoint", default="",
+                    help="Checkpoint file, rewritten every --checkpoint-every seconds during pair verification "
+                         "and removed once the output is written.")
+    ap.add_argument("--checkpoint-every", type=float, default=CHECKPOINT_EVERY, help="Seconds between checkpoints.")
+    ap.add_argument("--resume", action="store_true", help="Continue from --checkpoint instead of loading the inputs.")
+    ap.add_argument("--progress", action="store_true", help="Report verified pairs, pairs/s and ETA on stderr.")
+    tune = ap.add_mutually_exclusive_group()
+    tune.add_argument("--tune-pairs", type=int, default=0,
+                      help="Pick bucket_max/window per bucket family to find the most duplicates "
+                           "within this many candidate pairs (replaces --bucket-max/--window).")
+    tune.add_argument("--tune-seconds", type=float, default=0,
+                      help="Like --tune-pairs, with the budget from a measured verification rate.")
+    ap.add_argument("--no-collapse", action="store_true",
+                    help="Bucket and compare every row, without first collapsing rows identical in all columns.")
+    ap.add_argument("--spill-dir", default="",
+                    help="Out-of-core mode: spill rows to hash partitions of the blocking keys in this directory, "
+                         "merge one partition at a time and join them with a memory-mapped union-find. "
+                         "--resume reuses a finished spill and finished partitions.")
+    ap.add_argument("--memory-mb", type=int, default=2048,
+                    help="Memory per partition in out-of-core mode; sets the partition count.")
+    ap.add_argument("--plan", action="store_true",
+                    help="Dry run: print bucket size distributions, pair counts, memory and time estimates "
+                         "and the heaviest keys, then exit without merging.")
+    args = ap.parse_args()
+    if args.spill_dir:
+        if args.plan or args.tune_pairs or args.tune_seconds or args.checkpoint:
+            raise SystemExit("--spill-dir does not combine with --plan, --tune-* or --checkpoint.")
+        from merge_spill import merge_out_of_core
+        merge_out_of_core(args.inputs, args.output, args.sep, args.spill_dir, args.memory_mb,
+                          args.bucket_max, args.window, args.fuzzy_names, not args.no_collapse, args.resume)
+        return
+    if args.resume and not os.path.exists(args.checkpoint):
+        raise SystemExit(f"--resume needs an existing --checkpoint file, got {args.checkpoint!r}.")
+
+    options = {"inputs": args.inputs, "sep": args.sep, "bucket_max": args.bucket_max,
+               "window": args.window, "fuzzy_names": args.fuzzy_names,
+               "tune_pairs": args.tune_pairs, "tune_seconds": args.tune_seconds, "no_collapse": args.no_collapse}
+    if args.resume:
+        stage, state, progress = load_checkpoint(args.checkpoint)
+        if stage["options"] != options:
+            raise SystemExit(f"{args.checkpoint} was written with different inputs or options: {stage['options']}")
+        df_all, buckets, limits = stage["df"], stage["buckets"], stage["limits"]
+        loyalty_ids, loyalty_vocab = stage["loyalty"]
+        group, reps = stage["groups"]
+        print(f"Resumed rows: {len(df_all)}, at pair {progress['cursor']}")
+    else:
+        df_all = load_inputs(args.inputs, args.sep)
+        print(f"Loaded rows: {len(df_all)}")
+        loyalty_ids, loyalty_vocab = intern_loyalty(df_all["loyalty_pairs"].tolist())
+        if args.no_collapse:
+            group = reps = np.arange(len(df_all))
+        else:
+            group, reps = collapse_exact_duplicates(df_all, loyalty_ids, args.fuzzy_names)
+            print(f"Distinct rows: {len(reps)} ({len(df_all) - len(reps)} exact duplicates collapsed)")
+    # blocking and verification run on one representative row per group
+    rows = df_all if len(reps) == len(df_all) else df_all.iloc[reps].reset_index(drop=True)
+    row_loyalty = loyalty_ids if len(reps) == len(df_all) else [loyalty_ids[i] for i in reps]
+    if not args.resume:
+        if args.plan:
+            print_plan(rows, (row_loyalty, loyalty_vocab), args.bucket_max, args.window, args.fuzzy_names)
+            return
+        buckets = build_buckets(rows, fuzzy=args.fuzzy_names, loyalty_ids=row_loyalty)
+        limits = None
+        if args.tune_pairs or args.tune_seconds:
+            budget = args.tune_pairs
+            if args.tune_seconds:
+                budget = int(args.tune_seconds * calibrate_rate(rows, row_loyalty, args.fuzzy_names))
+            limits = auto_tune(rows, row_loyalty, buckets, budget, args.bucket_max, args.window, args.fuzzy_names)
+        progress = {"cursor": 0, "merged": 0, "parent": None, "rank": None}
+        state = b""
+        if args.checkpoint:
+            state = pickle.dumps({"options": options, "df": df_all, "buckets": buckets, "limits": limits,
+                                  "loyalty": (loyalty_ids, loyalty_vocab), "groups": (group, reps)},
+                                 protocol=pickle.HIGHEST_PROTOCOL)
+
+    # sorted so that a cursor position means the same pair after a resume
+    candidate_pairs = sorted(generate_candidate_pairs(rows, buckets, bucket_max=args.bucket_max,
+                                                      window=args.window, limits=limits))
     print(f"pairs to check: {len(candidate_pairs)}")
 
-    dsu = DSU(len(df_all))
-
-    def row_dict(i: int) -> Dict[str, str]:
-        return {col: df_all.at[i, col] for col in REQUIRED_COLS}
-
-    checked = merged = 0
-    for a, b in candidate_pairs:
-        checked += 1
-        if is_duplicate(row_dict(a), row_dict(b)):
-            dsu.union(a, b)
-            merged += 1
-
-    print(f"Checked pairs: {checked}, merged pairs: {merged}")
+    dsu = DSU(len(rows))
+    if progress["parent"] is not None:
+        dsu.parent, dsu.rank = progress["parent"], progress["rank"]
+
+    def checkpoint(cursor: int):
+        save_checkpoint(args.checkpoint, state,
+                        {"cursor": cursor, "merged": merged, "parent": dsu.parent, "rank": dsu.rank})
+
+    total = len(candidate_pairs)
+    cursor = start = progress["cursor"]
+    merged = progress["merged"]
+    if args.checkpoint and not args.resume:
+        checkpoint(cursor)
+    started = last_report = last_save = time.monotonic()
+    # with a checkpoint, Ctrl-C only sets a flag that is acted on between pairs,
+    # so the saved cursor and merge count always describe fully processed pairs
+    interrupted = []
+    if args.checkpoint:
+        previous_handler = signal.signal(signal.SIGINT, lambda *_: interrupted.append(True))
+    try:
+        for cursor in range(start, total):
+            a, b = candidate_pairs[cursor]
+            if is_duplicate(row_dict(rows, row_loyalty, a), row_dict(rows, row_loyalty, b), args.fuzzy_names):
+                dsu.union(a, b)
+                merged += 1
+            if cursor % TICK_PAIRS == 0:
+                now = time.monotonic()
+                if args.progress and now - last_report >= PROGRESS_EVERY:
+                    report_progress(cursor + 1, total, (cursor + 1 - start) / (now - started))
+                    last_report = now
+                if args.checkpoint and now - last_save >= args.checkpoint_every:
+                    checkpoint(cursor + 1)
+                    last_save = now
+            if interrupted:
+                checkpoint(cursor + 1)
+                raise SystemExit(f"\nInterrupted at pair {cursor + 1}/{total}; checkpoint saved to {args.checkpoint}")
+    finally:
+        if args.checkpoint:
+            signal.signal(signal.SIGINT, previous_handler)
+    if args.progress:
+        elapsed = time.monotonic() - started
+        report_progress(total, total, (total - start) / elapsed if elapsed > 0 else 0.0)
+        print(file=sys.stderr)
+
+    print(f"Checked pairs: {total}, merged pairs: {merged}")
 
     clusters = defaultdict(list)
-    for i in range(len(df_all)):
-        clusters[dsu.find(i)].append(i)
+    for i, g in enumerate(group.tolist()):
+        clusters[dsu.find(g)].append(i)
 
     out_rows = []
     for _, idxs in clusters.items():
-        agg = aggregate_cluster(df_all, idxs)
+        agg = aggregate_cluster(df_all, idxs, (loyalty_ids, loyalty_vocab))
         out_rows.append([agg.get(col, "") for col in OUTPUT_COLS])
 
     df_out = pd.DataFrame(out_rows, columns=OUTPUT_COLS)
-    df_out.to_csv(args.output, sep=";", index=False)
+    write_frame(df_out, args.output, sep=";", lineterminator="\n")
     print(f"Output rows: {len(df_out)}")
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,378 @@
+import csv
+import heapq
+import json
+import math
+import os
+import pickle
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from merge_flights import (
+    BUCKET_COLUMNS, DSU, OUTPUT_COLS, REQUIRED_COLS, aggregate_cluster, clean_header_name,
+    collapse_exact_duplicates, generate_candidate_pairs, intern_loyalty, is_duplicate, loyalty_union, norm,
+    parse_loyalty_set, row_dict,
+)
+from name_match import lsh_bands
+from table_io import TableWriter, is_columnar, open_input, read_records
+
+SPILL_CHUNK_ROWS = 100_000
+MIN_PARTITIONS = 16
+# peak partition working set per byte of input (~76 measured on a pair-light sample; each candidate pair adds ~150 bytes)
+SPILL_EXPANSION = 80
+RUN_ROWS = 10_000
+KEY_SEP = "\x1f"
+DONE_FILE = "spill.json"
+REQUIRED_INDEX = {c: i for i, c in enumerate(REQUIRED_COLS)}
+LOYALTY = REQUIRED_INDEX["loyalty_pairs"]
+
+
+def partition_count(paths: List[str], memory_mb: int) -> int:
+    size = sum(os.path.getsize(p) for p in paths)
+    return max(MIN_PARTITIONS, math.ceil(size * SPILL_EXPANSION / (memory_mb << 20)))
+
+
+def _sniff_sep(path: str, sep: str) -> str:
+    with open_input(path, "r", encoding="utf-8-sig", newline="", errors="replace") as f:
+        first = f.readline()
+    try:
+        return csv.Sniffer().sniff(first).delimiter
+    except csv.Error:
+        return sep
+
+
+def iter_input_rows(path: str, sep: str, chunk_rows: int = SPILL_CHUNK_ROWS) -> Iterator[List[List[str]]]:
+    """Normalized REQUIRED_COLS rows of one input, in chunks, with read_one_strict's header and row rules."""
+    kwargs = {} if is_columnar(path) else {"quoting": csv.QUOTE_NONE}
+    header, rows = read_records(path, sep, **kwargs)
+    names = [clean_header_name(c) if str(c).strip() != "" else "" for c in header]
+    missing = [c for c in REQUIRED_COLS if c not in names]
+    if missing and not is_columnar(path) and len(missing) > len(REQUIRED_COLS) // 2:
+        rows.close()
+        header, rows = read_records(path, _sniff_sep(path, sep), **kwargs)
+        names = [clean_header_name(c) if str(c).strip() != "" else "" for c in header]
+        missing = [c for c in REQUIRED_COLS if c not in names]
+    if missing:
+        rows.close()
+        raise ValueError(f"{path}: missing columns after header normalization: {missing}\n"
+                         f"Seen columns: {sorted(n for n in names if n)}")
+    picks = [names.index(c) for c in REQUIRED_COLS]
+    width = max(picks) + 1
+    chunk = []
+    for n, row in enumerate(rows, 1):
+        if not row:  # blank line; pandas skips those too
+            continue
+        if len(row) > len(header):
+            rows.close()
+            raise ValueError(f"{path}: record {n} has {len(row)} fields, the header has {len(header)}")
+        if len(row) < width:
+            row = row + [""] * (width - len(row))
+        chunk.append([norm(row[i]) for i in picks])
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bucket_keys(row: List[str], fuzzy: bool = False) -> Iterator[Tuple[str, str]]:
+    """(family, key) of every bucket build_buckets puts the row in."""
+    for family, cols in BUCKET_COLUMNS.items():
+        values = [row[REQUIRED_INDEX[c]] for c in cols]
+        if all(values):
+            yield family, KEY_SEP.join(values)
+    for token in parse_loyalty_set(row[REQUIRED_INDEX["loyalty_pairs"]]):
+        yield "B6", token
+    if fuzzy and row[REQUIRED_INDEX["flight_date"]]:
+        date = row[REQUIRED_INDEX["flight_date"]]
+        for band, sig in lsh_bands(row[REQUIRED_INDEX["real_first_name"]], row[REQUIRED_INDEX["real_last_name"]]):
+            yield "B7", f"{date}{KEY_SEP}{band}{KEY_SEP}{sig.hex()}"
+
+
+def _append(path: str, obj):
+    with open(path, "ab") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _load_all(path: str) -> Iterator:
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def clear_spill(spill_dir: str, prefixes=("rows", "part", "oversized", "edges", "labels", "agg", "run")):
+    for name in os.listdir(spill_dir):
+        if name.startswith(prefixes) and name.endswith((".pkl", ".npy")):
+            os.remove(os.path.join(spill_dir, name))
+
+
+def partition_of(family: str, key: str, partitions: int) -> int:
+    return zlib.crc32(f"{family}{KEY_SEP}{key}".encode("utf-8")) % partitions
+
+
+def spill(paths: List[str], sep: str, spill_dir: str, partitions: int, fuzzy: bool = False) -> int:
+    """Write the row store and one membership file per partition; returns the row count.
+
+    A bucket key always hashes to the same partition, so every bucket is
+    complete inside one partition; a row is copied to each partition one
+    of its keys lands in.
+    """
+    clear_spill(spill_dir)
+    rows_path = os.path.join(spill_dir, "rows.pkl")
+    n = 0
+    for path in paths:
+        for chunk in iter_input_rows(path, sep):
+            _append(rows_path, (n, chunk))
+            part_rows = defaultdict(dict)
+            part_members = defaultdict(list)
+            for g, row in enumerate(chunk, start=n):
+                for family, key in bucket_keys(row, fuzzy):
+                    p = partition_of(family, key, partitions)
+                    part_rows[p][g] = row
+                    part_members[p].append((family, key, g))
+            for p, members in part_members.items():
+                _append(os.path.join(spill_dir, f"part{p:04d}.pkl"), (list(part_rows[p].items()), members))
+            n += len(chunk)
+    return n
+
+
+def load_partition(spill_dir: str, p: int, fuzzy: bool = False, collapse: bool = True):
+    """(row ids, representative rows, their loyalty ids, representative per row, buckets) of one partition.
+
+    Buckets hold representative positions in row order, as build_buckets
+    would list them.
+    """
+    rows: Dict[int, List[str]] = {}
+    members = []
+    for part_rows, part_members in _load_all(os.path.join(spill_dir, f"part{p:04d}.pkl")):
+        rows.update(part_rows)
+        members.extend(part_members)
+    ids = np.array(sorted(rows), dtype=np.int64)
+    local = {g: i for i, g in enumerate(ids.tolist())}
+    df = pd.DataFrame([rows[g] for g in ids.tolist()], columns=REQUIRED_COLS)
+    rows.clear()
+    loyalty_ids, _ = intern_loyalty(df["loyalty_pairs"].tolist())
+    if collapse and len(df):
+        group, reps = collapse_exact_duplicates(df, loyalty_ids, fuzzy)
+    else:
+        group = reps = np.arange(len(df))
+    rep_df = df if len(reps) == len(df) else df.iloc[reps].reset_index(drop=True)
+    rep_loyalty = loyalty_ids if len(reps) == len(df) else [loyalty_ids[i] for i in reps]
+    group_of = group.tolist()
+    buckets = defaultdict(lambda: defaultdict(dict))
+    for family, key, g in members:
+        buckets[family][key][group_of[local[g]]] = None
+    buckets = {family: {key: list(idxs) for key, idxs in b.items()} for family, b in buckets.items()}
+    return ids, rep_df, rep_loyalty, group_of, buckets
+
+
+def oversized_keys(spill_dir: str, partitions: int, bucket_max: int,
+                   fuzzy: bool = False, collapse: bool = True) -> set:
+    """(family, key) of every bucket over bucket_max, i.e. paired by sorted neighborhood only."""
+    path = os.path.join(spill_dir, "oversized.pkl")
+    if os.path.exists(path):
+        return next(_load_all(path))
+    keys = set()
+    for p in range(partitions):
+        buckets = load_partition(spill_dir, p, fuzzy, collapse)[4]
+        keys.update((family, key) for family, b in buckets.items() for key, idxs in b.items() if len(idxs) > bucket_max)
+    tmp = path + ".tmp"
+    _append(tmp, keys)
+    os.replace(tmp, path)
+    return keys
+
+
+def process_partition(spill_dir: str, p: int, partitions: int, oversized: set, bucket_max: int,
+                      window: int, fuzzy: bool = False, collapse: bool = True) -> Tuple[int, int, int]:
+    """Verify one partition's candidate pairs; writes (row, component min row) edges.
+
+    Two rows sharing several keys meet in several partitions. A pair is
+    verified only in the lowest partition holding a shared key whose bucket
+    is not oversized (every such bucket pairs all its rows), or wherever it
+    comes up when all shared buckets are oversized.
+    Returns (rows, pairs checked, merged pairs).
+    """
+    ids, rep_df, rep_loyalty, group_of, buckets = load_partition(spill_dir, p, fuzzy, collapse)
+    rep_rows = rep_df.to_numpy(dtype=object).tolist()
+    combined = {}
+
+    def combined_parts(r: int) -> Dict[Tuple[str, str], int]:
+        parts = combined.get(r)
+        if parts is None:
+            parts = combined[r] = {k: partition_of(*k, partitions) for k in bucket_keys(rep_rows[r], fuzzy)
+                                   if k not in oversized}
+        return parts
+
+    pairs = generate_candidate_pairs(rep_df, buckets, bucket_max=bucket_max, window=window)
+    dsu = DSU(len(rep_df))
+    checked = merged = 0
+    for a, b in sorted(pairs):
+        pa, pb = combined_parts(a), combined_parts(b)
+        owners = [part for k, part in pa.items() if k in pb]
+        if owners and min(owners) != p:
+            continue
+        checked += 1
+        if is_duplicate(row_dict(rep_df, rep_loyalty, a), row_dict(rep_df, rep_loyalty, b), fuzzy):
+            dsu.union(a, b)
+            merged += 1
+    roots = np.array([dsu.find(r) for r in group_of], dtype=np.int64)
+    low = np.full(len(rep_df), len(ids), dtype=np.int64)
+    np.minimum.at(low, roots, np.arange(len(ids)))
+    u = ids
+    v = ids[low[roots]]
+    keep = u != v
+    tmp = os.path.join(spill_dir, f"edges{p:04d}.tmp.npy")
+    np.save(tmp, np.stack([u[keep], v[keep]]))
+    os.replace(tmp, os.path.join(spill_dir, f"edges{p:04d}.npy"))
+    return len(ids), checked, merged
+
+
+def _roots(parent: np.ndarray, x: np.ndarray) -> np.ndarray:
+    r = parent[x]
+    while True:
+        nr = parent[r]
+        if np.array_equal(nr, r):
+            return r
+        r = nr
+
+
+def union_edges(spill_dir: str, n: int, partitions: int, chunk: int = 1 << 20) -> np.ndarray:
+    """Component label (smallest row id) per row in a memory-mapped int64 array.
+
+    Edge files are replayed until no edge joins two roots; each pass hooks
+    the larger root onto the smaller one, so parents only ever decrease.
+    """
+    parent = np.lib.format.open_memmap(os.path.join(spill_dir, "labels.npy"), mode="w+",
+                                       dtype=np.int64, shape=(n,))
+    for start in range(0, n, chunk):
+        parent[start:start + chunk] = np.arange(start, min(start + chunk, n))
+    edge_files = [os.path.join(spill_dir, f"edges{p:04d}.npy") for p in range(partitions)]
+    while True:
+        changed = False
+        for path in edge_files:
+            u, v = np.load(path)
+            for start in range(0, len(u), chunk):
+                ru = _roots(parent, u[start:start + chunk])
+                rv = _roots(parent, v[start:start + chunk])
+                live = ru != rv
+                if live.any():
+                    changed = True
+                    np.minimum.at(parent, np.maximum(ru, rv)[live], np.minimum(ru, rv)[live])
+        for start in range(0, n, chunk):
+            ids = np.arange(start, min(start + chunk, n))
+            parent[start:start + chunk] = _roots(parent, ids)
+        if not changed:
+            parent.flush()
+            return parent
+
+
+def _write_run(path: str, items: List[Tuple[int, List[str]]]):
+    with open(path, "wb") as f:
+        for start in range(0, len(items), RUN_ROWS):
+            pickle.dump(items[start:start + RUN_ROWS], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _read_run(path: str) -> Iterator[Tuple[int, List[str]]]:
+    for block in _load_all(path):
+        yield from block
+
+
+def aggregate(spill_dir: str, labels: np.ndarray, partitions: int, output: str) -> int:
+    """Stream the row store into per-label partitions, aggregate each and merge the sorted runs.
+
+    Output rows come out ordered by their cluster's smallest row id, the
+    order the in-memory merge writes them in.
+    """
+    clear_spill(spill_dir, ("agg", "run"))
+    for g0, chunk in _load_all(os.path.join(spill_dir, "rows.pkl")):
+        lab = np.asarray(labels[g0:g0 + len(chunk)])
+        parts = defaultdict(list)
+        for g, label, row in zip(range(g0, g0 + len(chunk)), lab.tolist(), chunk):
+            parts[label % partitions].append((label, g, row))
+        for p, items in parts.items():
+            _append(os.path.join(spill_dir, f"agg{p:04d}.pkl"), items)
+
+    runs = []
+    n_out = 0
+    for p in range(partitions):
+        items = [it for block in _load_all(os.path.join(spill_dir, f"agg{p:04d}.pkl")) for it in block]
+        if not items:
+            continue
+        items.sort(key=lambda it: (it[0], it[1]))
+        df = pd.DataFrame([it[2] for it in items], columns=REQUIRED_COLS)
+        labels_p = np.array([it[0] for it in items], dtype=np.int64)
+        starts = np.flatnonzero(np.r_[True, labels_p[1:] != labels_p[:-1]])
+        ends = np.r_[starts[1:], len(items)]
+        out = []
+        for a, b in zip(starts.tolist(), ends.tolist()):
+            if b - a == 1:
+                # a single normalized row only has its loyalty tokens sorted and deduplicated
+                row = list(items[a][2])
+                row[LOYALTY] = loyalty_union(row[LOYALTY])
+                out.append((int(labels_p[a]), row))
+                continue
+            agg = aggregate_cluster(df, range(a, b))
+            out.append((int(labels_p[a]), [agg.get(col, "") for col in OUTPUT_COLS]))
+        run = os.path.join(spill_dir, f"run{p:04d}.pkl")
+        _write_run(run, out)
+        runs.append(run)
+        n_out += len(out)
+        os.remove(os.path.join(spill_dir, f"agg{p:04d}.pkl"))
+
+    with TableWriter(output, OUTPUT_COLS, sep=";", lineterminator="\n") as w:
+        w.writetuples(row for _, row in heapq.merge(*(_read_run(r) for r in runs), key=lambda it: it[0]))
+    return n_out
+
+
+def merge_out_of_core(paths: List[str], output: str, sep: str, spill_dir: str, memory_mb: int,
+                      bucket_max: int, window: int, fuzzy: bool = False, collapse: bool = True,
+                      resume: bool = False):
+    """merge_flights with rows, buckets and pairs kept per hash partition on disk.
+
+    With resume, a finished spill and the partitions whose edge files
+    exist are reused.
+    """
+    os.makedirs(spill_dir, exist_ok=True)
+    options = {"inputs": paths, "sep": sep, "bucket_max": bucket_max, "window": window,
+               "fuzzy_names": fuzzy, "collapse": collapse}
+    done_path = os.path.join(spill_dir, DONE_FILE)
+    done = None
+    if resume and os.path.exists(done_path):
+        with open(done_path, encoding="utf-8") as f:
+            done = json.load(f)
+        if done["options"] != options:
+            raise SystemExit(f"{spill_dir} was spilled with different inputs or options: {done['options']}")
+    if done is None:
+        partitions = partition_count(paths, memory_mb)
+        n = spill(paths, sep, spill_dir, partitions, fuzzy)
+        done = {"options": options, "rows": n, "partitions": partitions}
+        with open(done_path, "w", encoding="utf-8") as f:
+            json.dump(done, f)
+    n, partitions = done["rows"], done["partitions"]
+    print(f"Loaded rows: {n}, spilled into {partitions} partitions")
+
+    oversized = oversized_keys(spill_dir, partitions, bucket_max, fuzzy, collapse)
+    checked = merged = 0
+    for p in range(partitions):
+        if resume and os.path.exists(os.path.join(spill_dir, f"edges{p:04d}.npy")):
+            continue
+        rows, pairs, m = process_partition(spill_dir, p, partitions, oversized, bucket_max, window, fuzzy, collapse)
+        checked += pairs
+        merged += m
+        print(f"partition {p + 1}/{partitions}: {rows} rows, {pairs} pairs, {m} merged")
+    print(f"Checked pairs: {checked}, merged pairs: {merged}")
+
+    labels = union_edges(spill_dir, n, partitions)
+    n_out = aggregate(spill_dir, labels, partitions, output)
+    del labels
+    print(f"Output rows: {n_out}")
+    clear_spill(spill_dir)
+    os.remove(done_path)
@@ -0,0 +1,101 @@
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+from change_lang import TRANSLIT_TABLE
+
+# spelling variants folded together after transliteration (IU/YU, KH/H, ...), applied in order
+FOLD_RULES = [(re.compile(p), r) for p, r in (
+    (r"SHCH|SCH", "SH"),
+    (r"TCH", "CH"),
+    (r"KH", "H"),
+    (r"TS|TZ|CZ", "C"),
+    (r"ZH", "J"),
+    (r"[IYJ]U", "U"),
+    (r"[IYJ]A", "A"),
+    (r"[IYJ]E", "E"),
+    (r"Y", "I"),
+    (r"W", "V"),
+    (r"PH", "F"),
+    (r"CK|Q", "K"),
+    (r"(.)\1+", r"\1"),
+)]
+NON_ALNUM_RE = re.compile(r"[^A-Z0-9]")
+
+NUM_PERM = 16
+BANDS = 8
+ROWS_PER_BAND = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = np.random.RandomState(20171)
+PERM_A = _rng.randint(1, 1 << 31, NUM_PERM).astype(np.uint64)
+PERM_B = _rng.randint(0, 1 << 31, NUM_PERM).astype(np.uint64)
+
+
+@lru_cache(maxsize=1 << 16)
+def name_key(name: str) -> str:
+    """Transliterated, upper-cased name with common spelling variants folded."""
+    s = NON_ALNUM_RE.sub("", name.translate(TRANSLIT_TABLE).upper())
+    for pattern, repl in FOLD_RULES:
+        s = pattern.sub(repl, s)
+    return s
+
+
+def max_edits(a: str, b: str) -> int:
+    return 1 if max(len(a), len(b)) <= 6 else 2
+
+
+def within_edits(a: str, b: str, k: int) -> bool:
+    """Levenshtein distance <= k, computed on a band of width 2k+1 with early exit."""
+    if abs(len(a) - len(b)) > k:
+        return False
+    if a == b:
+        return True
+    big = k + 1
+    prev = [j if j <= k else big for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        lo, hi = max(1, i - k), min(len(b), i + k)
+        cur = [big] * (len(b) + 1)
+        if i <= k:
+            cur[0] = i
+        ca = a[i - 1]
+        for j in range(lo, hi + 1):
+            cost = prev[j - 1] + (ca != b[j - 1])
+            if prev[j] + 1 < cost:
+                cost = prev[j] + 1
+            if cur[j - 1] + 1 < cost:
+                cost = cur[j - 1] + 1
+            cur[j] = cost if cost < big else big
+        if min(cur[lo - 1:hi + 1]) > k:
+            return False
+        prev = cur
+    return prev[len(b)] <= k
+
+
+@lru_cache(maxsize=1 << 16)
+def names_similar(a: str, b: str) -> bool:
+    """eq_wild for names plus transliteration folding and a bounded edit distance."""
+    if a == b or not a or not b:
+        return True
+    ka, kb = name_key(a), name_key(b)
+    if not ka or not kb:
+        return False
+    return ka == kb or within_edits(ka, kb, max_edits(ka, kb))
+
+
+def _minhash(key: str) -> np.ndarray:
+    padded = f"^{key}$"
+    grams = {padded[i:i + 2] for i in range(len(padded) - 1)}
+    h = np.fromiter((zlib.crc32(g.encode()) for g in grams), dtype=np.uint64, count=len(grams))
+    return ((PERM_A[:, None] * h + PERM_B[:, None]) % _PRIME).min(axis=1)
+
+
+@lru_cache(maxsize=1 << 16)
+def lsh_bands(first: str, last: str) -> tuple:
+    """MinHash-LSH band keys of the folded full name; similar names share a band with high probability."""
+    key = name_key(first) + " " + name_key(last)
+    if not key.strip():
+        return ()
+    sig = _minhash(key).reshape(BANDS, ROWS_PER_BAND)
+    return tuple((band, row.tobytes()) for band, row in enumerate(sig))
@@ -0,0 +1,179 @@
+import csv
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+from table_io import TableWriter, is_columnar, open_output
+
+BLOCK = 1024 * 1024
+MIN_CHUNK = 4 * 1024 * 1024
+CHUNKS_PER_WORKER = 4
+TAG_NAME_END = b" \t\r\n>/"
+
+
+def _next_record_start(f, pos: int, quote: bytes = b"", parity: int = 0) -> int:
+    """First offset after a newline at or past `pos` that is not inside quotes.
+
+    `parity` is the number of quote bytes (mod 2) seen between the last known
+    record boundary and `pos`. Returns the file size when no boundary follows.
+    """
+    f.seek(pos)
+    while True:
+        block = f.read(BLOCK)
+        if not block:
+            return pos
+        i = 0
+        while True:
+            nl = block.find(b"\n", i)
+            if nl < 0:
+                if quote:
+                    parity ^= block.count(quote, i) & 1
+                pos += len(block)
+                break
+            if quote:
+                parity ^= block.count(quote, i, nl) & 1
+            if not parity:
+                return pos + nl + 1
+            i = nl + 1
+
+
+def _quote_parity(f, start: int, end: int, quote: bytes) -> int:
+    f.seek(start)
+    parity = 0
+    remaining = end - start
+    while remaining > 0:
+        block = f.read(min(BLOCK, remaining))
+        if not block:
+            break
+        parity ^= block.count(quote) & 1
+        remaining -= len(block)
+    return parity
+
+
+def header_end(path: str, quote: bytes = b'"') -> int:
+    with open(path, "rb") as f:
+        return _next_record_start(f, 0, quote)
+
+
+def record_ranges(path: str, n_chunks: int, start: int = 0, quote: bytes = b'"'):
+    """Split [start, EOF) into up to n_chunks byte ranges on record boundaries.
+
+    With a quote byte, newlines inside quoted fields are skipped by tracking
+    quote parity from the previous boundary; pass quote=b"" for plain
+    line-oriented files.
+    """
+    size = os.path.getsize(path)
+    if start >= size:
+        return []
+    n_chunks = max(1, min(n_chunks, (size - start) // MIN_CHUNK or 1))
+    step = (size - start) / n_chunks
+
+    bounds = [start]
+    with open(path, "rb") as f:
+        for k in range(1, n_chunks):
+            target = int(start + k * step)
+            prev = bounds[-1]
+            if target <= prev:
+                continue
+            parity = _quote_parity(f, prev, target, quote) if quote else 0
+            b = _next_record_start(f, target, quote, parity)
+            if prev < b < size:
+                bounds.append(b)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _find_open_tag(f, pos: int, tag: bytes) -> int:
+    """Offset of the first `tag` (e.g. b"<user") at or after pos, or -1."""
+    f.seek(pos)
+    carry = b""
+    base = pos
+    while True:
+        block = f.read(BLOCK)
+        data = carry + block
+        i = data.find(tag)
+        while 0 <= i and i + len(tag) < len(data):
+            if data[i + len(tag)] in TAG_NAME_END:
+                return base + i
+            i = data.find(tag, i + 1)
+        if not block:
+            return -1
+        cut = max(0, len(data) - len(tag))
+        carry = data[cut:]
+        base += cut
+
+
+def _last_close_tag(f, size: int) -> int:
+    """Offset of the last b"</" in the file (the root closing tag), or -1."""
+    end = size
+    while end > 0:
+        start = max(0, end - BLOCK)
+        f.seek(start)
+        i = f.read(end - start + 1).rfind(b"</")
+        if i >= 0:
+            return start + i
+        end = start
+    return -1
+
+
+def element_ranges(path: str, n_chunks: int, tag: bytes):
+    """Split the children of the XML root into byte ranges starting at `tag`.
+
+    Every range holds whole sibling elements (plus whitespace between them),
+    so each one parses on its own once wrapped in a dummy root element.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        start = _find_open_tag(f, 0, tag)
+        end = _last_close_tag(f, size)
+        if start < 0 or end <= start:
+            return []
+        n_chunks = max(1, min(n_chunks, (end - start) // MIN_CHUNK or 1))
+        step = (end - start) / n_chunks
+        bounds = [start]
+        for k in range(1, n_chunks):
+            b = _find_open_tag(f, max(bounds[-1] + 1, int(start + k * step)), tag)
+            if b < 0 or b >= end:
+                break
+            bounds.append(b)
+    bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def read_range(path: str, start: int, end: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(end - start)
+
+
+def chunk_count(workers: int) -> int:
+    return max(1, workers) * CHUNKS_PER_WORKER
+
+
+def run_ordered(func, tasks, workers: int):
+    """Map func over tasks in a process pool, results in task order."""
+    if workers <= 1 or len(tasks) <= 1:
+        return [func(t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        return list(ex.map(func, tasks))
+
+
+def concat_parts(part_paths, fout):
+    for p in part_paths:
+        with open(p, "rb") as fin:
+            shutil.copyfileobj(fin, fout, BLOCK)
+        os.remove(p)
+
+
+def write_parts(part_paths, out_path: str, fieldnames, sep: str = ";", lineterminator: str = "\n"):
+    """Join header-less CSV part files into out_path (CSV, compressed CSV or columnar)."""
+    if is_columnar(out_path):
+        with TableWriter(out_path, fieldnames, sep=sep) as writer:
+            for p in part_paths:
+                with open(p, "r", encoding="utf-8", newline="") as f:
+                    writer.writetuples(csv.reader(f, delimiter=sep))
+                os.remove(p)
+        return
+    with open_output(out_path, "wb") as fout:
+        fout.write((sep.join(fieldnames) + lineterminator).encode("utf-8"))
+        concat_parts(part_paths, fout)
@@ -0,0 +1,167 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from scoring import ID_COLUMNS, load_city_list, parse_days
+from table_io import read_frame, write_frame
+
+PROFILE_SOURCE_COLUMNS = ID_COLUMNS + ["flight_date", "dep_city", "dep_airport", "arr_city", "arr_airport"]
+COUNT_COLUMNS = ["flights", "russia_arrivals", "intl_arrivals"]
+# left empty when no city list is given, as scoring skips the rule then
+ARRIVAL_COLUMNS = ["russia_arrivals", "intl_arrivals"]
+PROFILE_COLUMNS = ID_COLUMNS + [
+    "flights", "first_flight", "last_flight", "span_days",
+    "n_routes", "routes", "russia_arrivals", "intl_arrivals",
+]
+ROUTE_SEP = "|"
+DEFAULT_PROFILES = "passenger_profiles.parquet"
+
+
+def _iso(days: pd.Series) -> pd.Series:
+    return pd.to_datetime(days, unit="D").dt.strftime("%Y-%m-%d").fillna("")
+
+
+def _finish(parts: pd.DataFrame, routes: pd.DataFrame) -> pd.DataFrame:
+    """Turn per-key partial aggregates plus (key, route) pairs into profile rows."""
+    counted = bool(parts["russia_arrivals"].notna().all())
+    agg = parts.groupby(ID_COLUMNS, sort=True).agg(
+        flights=("flights", "sum"),
+        first_day=("first_day", "min"),
+        last_day=("last_day", "max"),
+        russia_arrivals=("russia_arrivals", "sum"),
+        intl_arrivals=("intl_arrivals", "sum"),
+    )
+    routes = routes[(routes["route"] != "").to_numpy()]
+    pairs = pd.DataFrame({
+        "code": agg.index.get_indexer(pd.MultiIndex.from_frame(routes[ID_COLUMNS])),
+        "route": routes["route"].to_numpy(dtype=object),
+    }).drop_duplicates().sort_values(["code", "route"])
+    codes = pairs["code"].to_numpy()
+    route_list = pairs["route"].tolist()
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else codes
+    ends = np.r_[starts[1:], len(codes)].astype(np.int64)
+
+    agg[ARRIVAL_COLUMNS] = agg[ARRIVAL_COLUMNS].astype(np.int64) if counted else np.nan
+    out = agg.reset_index()
+    out["n_routes"] = 0
+    out.loc[codes[starts], "n_routes"] = ends - starts
+    joined = np.full(len(out), "", dtype=object)
+    joined[codes[starts]] = [ROUTE_SEP.join(route_list[a:b]) for a, b in zip(starts, ends)]
+    out["routes"] = joined
+    out["first_flight"] = _iso(out["first_day"])
+    out["last_flight"] = _iso(out["last_day"])
+    out["span_days"] = (out["last_day"] - out["first_day"]).fillna(0).astype(np.int64)
+    return out[PROFILE_COLUMNS]
+
+
+def _flight_parts(df: pd.DataFrame, russian_cities=None):
+    df = df.loc[(df[ID_COLUMNS] != "").any(axis=1).to_numpy()]
+    days = parse_days(df["flight_date"])
+    dep = df["dep_airport"].where(df["dep_airport"] != "", df["dep_city"])
+    arr = df["arr_airport"].where(df["arr_airport"] != "", df["arr_city"])
+    if russian_cities is None:
+        russia_arrivals = intl_arrivals = np.full(len(df), np.nan)
+    else:
+        russia = df["arr_city"].isin(russian_cities).to_numpy()
+        russia_arrivals = russia.astype(np.int64)
+        intl_arrivals = ((df["arr_city"] != "").to_numpy() & ~russia).astype(np.int64)
+    keys = {c: df[c].to_numpy(dtype=object) for c in ID_COLUMNS}
+    parts = pd.DataFrame({
+        **keys,
+        "flights": 1,
+        "first_day": days,
+        "last_day": days,
+        "russia_arrivals": russia_arrivals,
+        "intl_arrivals": intl_arrivals,
+    })
+    routes = pd.DataFrame({**keys, "route": (dep + "-" + arr).where((dep != "") & (arr != ""), "").to_numpy()})
+    return parts, routes
+
+
+def build_profiles(df: pd.DataFrame, russian_cities=None) -> pd.DataFrame:
+    """Profile per (first name, last name, birth date) from merge_flights rows.
+
+    Arrivals count as Russian when arr_city is in russian_cities and as
+    international when arr_city is set and is not; without russian_cities
+    both counts are left empty. Routes are distinct DEP-ARR pairs (airport,
+    else city).
+    """
+    return _finish(*_flight_parts(df, russian_cities))
+
+
+def _profile_parts(profiles: pd.DataFrame):
+    parts = profiles[ID_COLUMNS + COUNT_COLUMNS].copy()
+    for col in COUNT_COLUMNS:
+        parts[col] = pd.to_numeric(parts[col])
+    parts["first_day"] = parse_days(profiles["first_flight"])
+    parts["last_day"] = parse_days(profiles["last_flight"])
+    routes = profiles[ID_COLUMNS + ["routes"]].copy()
+    routes["route"] = routes.pop("routes").str.split(ROUTE_SEP)
+    routes = routes.explode("route").fillna({"route": ""})
+    return parts, routes
+
+
+def update_profiles(profiles: pd.DataFrame, df: pd.DataFrame, russian_cities=None) -> pd.DataFrame:
+    """Fold new merged rows into an existing profile table.
+
+    Only passengers present in the new rows are re-aggregated. Counts add
+    up and date bounds widen, so the rows must not have been folded in before.
+    Arrival counts need the same city list (or none) as the table was built with.
+    """
+    if len(profiles) and bool(profiles["russia_arrivals"].notna().all()) != (russian_cities is not None):
+        built = "without" if russian_cities is not None else "with"
+        raise ValueError(f"the profile table was built {built} a city list; "
+                         "pass the same --russian-cities or use --rebuild")
+    new_parts, new_routes = _flight_parts(df, russian_cities)
+    touched = pd.MultiIndex.from_frame(profiles[ID_COLUMNS]).isin(
+        pd.MultiIndex.from_frame(new_parts[ID_COLUMNS]))
+    old_parts, old_routes = _profile_parts(profiles[touched])
+    changed = _finish(pd.concat([old_parts, new_parts], ignore_index=True),
+                      pd.concat([old_routes, new_routes], ignore_index=True))
+    out = pd.concat([profiles.loc[~touched, PROFILE_COLUMNS], changed], ignore_index=True)
+    return out.sort_values(ID_COLUMNS, kind="stable").reset_index(drop=True)
+
+
+def load_profiles(path: str) -> pd.DataFrame:
+    profiles = read_frame(path, columns=PROFILE_COLUMNS)
+    for col in ("flights", "span_days", "n_routes"):
+        profiles[col] = pd.to_numeric(profiles[col]).astype(np.int64)
+    for col in ARRIVAL_COLUMNS:
+        counts = pd.to_numeric(profiles[col].replace("", np.nan))
+        profiles[col] = counts if counts.isna().any() else counts.astype(np.int64)
+    return profiles
+
+
+def save_profiles(profiles: pd.DataFrame, path: str):
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.tmp{ext}"
+    write_frame(profiles, tmp, sep=";", lineterminator="\n")
+    os.replace(tmp, path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build or update the per-passenger travel profile table.")
+    ap.add_argument("inputs", nargs="+", help="New merge_flights output files (.csv, .parquet or .arrow).")
+    ap.add_argument("--profiles", default=DEFAULT_PROFILES,
+                    help="Profile table, updated in place when it exists (.parquet, .arrow or .csv).")
+    ap.add_argument("--russian-cities", default="", help="City list for the Russian/international arrival counts (left empty without it).")
+    ap.add_argument("--rebuild", action="store_true", help="Ignore an existing profile table.")
+    args = ap.parse_args()
+
+    cities = load_city_list(args.russian_cities) if args.russian_cities else None
+    df = pd.concat([read_frame(p, columns=PROFILE_SOURCE_COLUMNS) for p in args.inputs], ignore_index=True)
+    if os.path.exists(args.profiles) and not args.rebuild:
+        try:
+            profiles = update_profiles(load_profiles(args.profiles), df, cities)
+        except ValueError as e:
+            raise SystemExit(str(e))
+    else:
+        profiles = build_profiles(df, cities)
+    save_profiles(profiles, args.profiles)
+    print(f"Profiles: {len(profiles)} passengers, {int(profiles['flights'].sum())} flights")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+from functools import lru_cache
+from operator import itemgetter
+
+TARGET_COLUMNS = [
+    "real_first_name", "real_last_name", "birth_date",
+    "flight_date", "flight_time", "flight_no", "codeshare",
+    "dep_city", "dep_airport", "arr_city", "arr_airport",
+    "e_code", "e_ticket", "docs", "seat", "meal",
+    "booking_class", "fare_basis", "baggage", "loyalty_pairs",
+]
+
+# converter output: the target columns plus source and country columns
+EXTENDED_COLUMNS = [
+    "real_first_name", "real_last_name", "birth_date", "p_source",
+    "flight_date", "flight_time", "flight_no", "codeshare",
+    "dep_city", "dep_airport", "dep_country",
+    "arr_city", "arr_airport", "arr_country",
+    "e_code", "e_ticket", "docs", "seat", "meal",
+    "booking_class", "fare_basis", "baggage", "loyalty_pairs",
+]
+
+SYNONYMS = {
+    "dep-airport": "dep_airport",
+    "dep airport": "dep_airport",
+    "dep_air":     "dep_airport",
+    "arr-airport": "arr_airport",
+    "arr airport": "arr_airport",
+    "arr_air":     "arr_airport",
+    "flight time": "flight_time",
+    "flight date": "flight_date",
+    "flight no":   "flight_no",
+    "loyalty":     "loyalty_pairs",
+    "loyaltypair": "loyalty_pairs",
+    "e-ticket":    "e_ticket",
+    "e ticket":    "e_ticket",
+    "e_code ":     "e_code",
+    "fare":        "fare_basis",
+}
+
+# headers of the agency export handled by csv_to_csv
+SOURCE_TO_TARGET = {
+    "PassengerFirstName": "real_first_name",
+    "PassengerLastName": "real_last_name",
+    "PassengerBirthDate": "birth_date",
+    "FlightDate": "flight_date",
+    "FlightTime": "flight_time",
+    "FlightNumber": "flight_no",
+    "CodeShare": "codeshare",
+    "Destination": "arr_city",
+    "BookingCode": "e_code",
+    "TicketNumber": "e_ticket",
+    "PassengerDocument": "docs",
+    "Baggage": "baggage",
+}
+
+TARGET_SET = frozenset(TARGET_COLUMNS)
+TARGET_BY_LOWER = {c.lower(): c for c in TARGET_COLUMNS}
+
+
+def normalize_header(name: str) -> str:
+    return " ".join(name.strip().split())
+
+
+def clean_header_name(name: str) -> str:
+    if name is None:
+        return ""
+    s = (str(name)
+         .replace("\ufeff", "")
+         .replace("\xa0", " ")
+         .strip())
+    s = "_".join(s.lower().replace("-", " ").split())
+    if s in SYNONYMS:
+        s = SYNONYMS[s]
+    return s
+
+
+def is_loyalty_card(token: str) -> bool:
+    """False for placeholder loyalty tokens such as "::" or "SU::" (empty program or number)."""
+    parts = token.split(":")
+    return bool(parts[0].strip() and parts[-1].strip())
+
+
+def source_name(name: str):
+    """Target column for an agency export header, or None."""
+    return SOURCE_TO_TARGET.get(normalize_header(name))
+
+
+def target_name(name: str):
+    """Target column whose name matches the header case-insensitively, or None."""
+    return TARGET_BY_LOWER.get(normalize_header(name).lower())
+
+
+def synonym_name(name: str):
+    """Target column for a header after synonym cleanup (as merge_flights reads it), or None."""
+    s = clean_header_name(name)
+    return s if s in TARGET_SET else None
+
+
+@lru_cache(maxsize=256)
+def projection_plan(header: tuple, targets: tuple = tuple(TARGET_COLUMNS), rename=target_name) -> tuple:
+    """Source index for every target column (-1 when absent); the last matching header wins."""
+    pos = {}
+    for i, h in enumerate(header):
+        name = rename(h)
+        if name:
+            pos[name] = i
+    return tuple(pos.get(t, -1) for t in targets)
+
+
+def row_projector(header, targets=TARGET_COLUMNS, rename=target_name):
+    """Return a function mapping a source row (list of str) to a tuple in targets order.
+
+    Cells past the header width are ignored, missing cells of short rows and
+    absent target columns come out as "". The row itself is not modified.
+    """
+    width = len(header)
+    plan = projection_plan(tuple(header), tuple(targets), rename)
+    if len(plan) == 1:
+        one = plan[0]
+        pick = lambda r: (r[one],)
+    else:
+        pick = itemgetter(*plan)
+    # absent targets read index -1, the "" appended behind the row
+    complete = -1 not in plan
+    tail = [""]
+
+    def project(row):
+        n = len(row)
+        if n < width:
+            return pick(row + [""] * (width - n + 1))
+        return pick(row) if complete else pick(row + tail)
+    return project
@@ -0,0 +1,250 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from id_graph import RING_MIN, ring_features
+from table_io import open_input, read_frame, write_frame
+
+ID_COLUMNS = ["real_first_name", "real_last_name", "birth_date"]
+# rows without any of these are dropped before scoring
+IDENTITY_COLUMNS = ID_COLUMNS + ["docs", "e_ticket", "loyalty_pairs"]
+SCORING_COLUMNS = IDENTITY_COLUMNS + ["e_code", "flight_date", "arr_city"]
+
+DEFAULT_WEIGHTS = {"ticket": 8, "30d": 4, "russia_intl": 2, "docs": 1}
+# rules that only run when given a weight, e.g. --weight ring=4
+OPTIONAL_RULES = ("ring",)
+WINDOW_DAYS = 30
+MAX_FLIGHTS = 5
+MIN_RUSSIA = 1
+MIN_INTL = 2
+DATE_FALLBACK_FORMATS = ("%d.%m.%Y", "%d/%m/%Y")
+
+
+def load_flights(path: str) -> pd.DataFrame:
+    df = read_frame(path, columns=SCORING_COLUMNS)
+    keep = np.zeros(len(df), dtype=bool)
+    for col in IDENTITY_COLUMNS:
+        keep |= (df[col] != "").to_numpy()
+    return df.loc[keep].reset_index(drop=True)
+
+
+def load_city_list(path: str) -> set:
+    """One city per line; a leading 'city' header line is skipped."""
+    with open_input(path, "r", encoding="utf-8-sig") as f:
+        cities = [line.strip() for line in f]
+    if cities and cities[0].lower() == "city":
+        cities = cities[1:]
+    return {c for c in cities if c}
+
+
+def passenger_ids(df: pd.DataFrame):
+    """Integer passenger code per row and the 'first last birth' ID for each code."""
+    ids = df[ID_COLUMNS[0]] + " " + df[ID_COLUMNS[1]] + " " + df[ID_COLUMNS[2]]
+    codes, uniques = pd.factorize(ids)
+    return codes, np.asarray(uniques, dtype=object)
+
+
+def parse_days(values: pd.Series) -> np.ndarray:
+    """Days since epoch per row (float, NaN when unparseable), parsing each distinct date once."""
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    dt = pd.to_datetime(uniques, format="%Y-%m-%d", errors="coerce")
+    for fmt in DATE_FALLBACK_FORMATS:
+        todo = dt.isna()
+        if not todo.any():
+            break
+        dt[todo] = pd.to_datetime(uniques[todo], format=fmt, errors="coerce")
+    days = (dt.to_numpy(dtype="datetime64[D]").astype(np.int64)).astype(float)
+    days[dt.isna().to_numpy()] = np.nan
+    out = np.full(len(values), np.nan)
+    out[codes >= 0] = days[codes[codes >= 0]]
+    return out
+
+
+def prepare(df: pd.DataFrame, russian_cities=None, window: int = WINDOW_DAYS,
+            max_flights: int = MAX_FLIGHTS, ring_min: int = RING_MIN) -> dict:
+    codes, ids = passenger_ids(df)
+    ctx = {
+        "df": df,
+        "window": window,
+        "max_flights": max_flights,
+        "ring_min": ring_min,
+        "pid": codes,
+        "ids": ids,
+        "n_ids": len(ids),
+        "days": parse_days(df["flight_date"]),
+    }
+    if russian_cities is not None:
+        ctx["is_russia"] = df["arr_city"].isin(russian_cities).to_numpy()
+    return ctx
+
+
+def shared_key(ctx: dict, column: str) -> np.ndarray:
+    """Flag passengers who share a non-empty `column` value with another passenger."""
+    values = ctx["df"][column]
+    mask = (values != "").to_numpy()
+    keys, _ = pd.factorize(values[mask])
+    n_ids = ctx["n_ids"]
+    pairs = pd.unique(keys.astype(np.int64) * n_ids + ctx["pid"][mask])
+    key_of, pid_of = np.divmod(pairs, n_ids)
+    shared = np.bincount(key_of) > 1
+    flags = np.zeros(n_ids, dtype=bool)
+    flags[pid_of[shared[key_of]]] = True
+    return flags
+
+
+def _sorted_flights(ctx: dict):
+    """Row order by (passenger, day) over rows with a parsed date, computed once per context."""
+    if "sorted" not in ctx:
+        valid = np.flatnonzero(~np.isnan(ctx["days"]))
+        order = valid[np.lexsort((ctx["days"][valid], ctx["pid"][valid]))]
+        ctx["sorted"] = order, ctx["pid"][order], ctx["days"][order]
+    return ctx["sorted"]
+
+
+def window_ends(pid: np.ndarray, days: np.ndarray, window: int) -> np.ndarray:
+    """For rows sorted by (passenger, day): one past the last row of the same passenger before day + window.
+
+    Passenger and day are packed into one int64 key, so a single
+    searchsorted over the whole table finds every window end.
+    """
+    if not len(pid):
+        return np.zeros(0, dtype=np.int64)
+    days = days.astype(np.int64)
+    base = days.min()
+    span = int(days.max() - base) + window + 1
+    key = pid.astype(np.int64) * span + (days - base)
+    return np.searchsorted(key, key + window, side="left")
+
+
+def _windows(ctx: dict):
+    """Sorted passenger codes, window start positions and ends for ctx["window"], computed once."""
+    if "windows" not in ctx:
+        _, pid, days = _sorted_flights(ctx)
+        ends = window_ends(pid, days, ctx["window"])
+        ctx["windows"] = pid, np.arange(len(pid)), ends
+    return ctx["windows"]
+
+
+def peak_window_counts(ctx: dict) -> np.ndarray:
+    """Most flights any passenger has inside one ctx["window"]-day window (0 without dated flights)."""
+    pid, starts, ends = _windows(ctx)
+    peak = np.zeros(ctx["n_ids"], dtype=np.int64)
+    if len(pid):
+        first = np.flatnonzero(np.r_[True, pid[1:] != pid[:-1]])
+        peak[pid[first]] = np.maximum.reduceat(ends - starts, first)
+    return peak
+
+
+def frequent_flyer(ctx: dict) -> np.ndarray:
+    """Flag passengers with more than ctx["max_flights"] flights in one window."""
+    return peak_window_counts(ctx) > ctx["max_flights"]
+
+
+def russia_intl(ctx: dict) -> np.ndarray:
+    """Flag passengers with MIN_RUSSIA Russian and MIN_INTL international flights in one window."""
+    order, _, _ = _sorted_flights(ctx)
+    pid, starts, ends = _windows(ctx)
+    cum = np.r_[0, np.cumsum(ctx["is_russia"][order])]
+    russian = cum[ends] - cum[starts]
+    intl = (ends - starts) - russian
+    hit = (russian >= MIN_RUSSIA) & (intl >= MIN_INTL)
+    flags = np.zeros(ctx["n_ids"], dtype=bool)
+    flags[pid[hit]] = True
+    return flags
+
+
+def ring_sizes(ctx: dict) -> np.ndarray:
+    """Passengers in each passenger's shared-identifier component (see id_graph), computed once."""
+    if "ring_size" not in ctx:
+        features = ring_features(ctx["df"], ctx["pid"], ctx["n_ids"])
+        ctx["ring_size"] = features["ring_size"].to_numpy()
+    return ctx["ring_size"]
+
+
+def ring(ctx: dict) -> np.ndarray:
+    """Flag passengers linked to at least ctx["ring_min"] - 1 others through shared identifiers."""
+    return ring_sizes(ctx) >= ctx["ring_min"]
+
+
+RULES = {
+    "ticket": lambda ctx: shared_key(ctx, "e_ticket"),
+    "docs": lambda ctx: shared_key(ctx, "docs"),
+    "30d": frequent_flyer,
+    "russia_intl": russia_intl,
+    "ring": ring,
+}
+
+
+def score(df: pd.DataFrame, weights=None, russian_cities=None, window: int = WINDOW_DAYS,
+          max_flights: int = MAX_FLIGHTS, ring_min: int = RING_MIN) -> pd.DataFrame:
+    """Weighted suspicion score per passenger ID, one 0/1 column per rule; flagged IDs only.
+
+    peak_flights is the most flights the passenger has in one window;
+    ring_size is added when the ring rule runs.
+    """
+    weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+    if russian_cities is None:
+        weights.pop("russia_intl", None)
+    ctx = prepare(df, russian_cities, window, max_flights, ring_min)
+
+    total = np.zeros(ctx["n_ids"], dtype=np.int64)
+    out = {"ID": ctx["ids"]}
+    for name, weight in weights.items():
+        flags = RULES[name](ctx)
+        out[name] = flags.astype(np.int8)
+        total += flags * weight
+    out["peak_flights"] = peak_window_counts(ctx)
+    if "ring_size" in ctx:
+        out["ring_size"] = ctx["ring_size"]
+    out["score"] = total
+
+    table = pd.DataFrame(out)
+    table = table[table["score"] > 0]
+    return table.sort_values(["score", "ID"], ascending=[False, True], kind="stable").reset_index(drop=True)
+
+
+def parse_weights(items) -> dict:
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in items or []:
+        name, _, value = item.partition("=")
+        if name not in RULES or not value:
+            raise SystemExit(f"Bad --weight {item!r}; rules: {', '.join(RULES)}")
+        weights[name] = int(value)
+    return {name: w for name, w in weights.items() if w}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Score suspicious passengers in merge_flights output.")
+    ap.add_argument("input", help="merge_flights output (.csv, .parquet or .arrow).")
+    ap.add_argument("--output", "-o", default="sus_scores.csv", help="Score table (.csv, .parquet or .arrow).")
+    ap.add_argument("--russian-cities", default="",
+                    help="City list for the russia_intl rule; the rule is skipped without it.")
+    ap.add_argument("--weight", action="append", metavar="RULE=W",
+                    help=f"Set a rule weight, 0 disables it (defaults: {DEFAULT_WEIGHTS}; "
+                         f"off unless weighted: {', '.join(OPTIONAL_RULES)}).")
+    ap.add_argument("--window-days", type=int, default=WINDOW_DAYS,
+                    help="Window length for the 30d and russia_intl rules.")
+    ap.add_argument("--max-flights", type=int, default=MAX_FLIGHTS,
+                    help="The 30d rule flags more than this many flights in one window.")
+    ap.add_argument("--ring-min", type=int, default=RING_MIN,
+                    help="The ring rule flags shared-identifier components with this many passengers.")
+    ap.add_argument("--top", type=int, default=30, help="How many top IDs to print.")
+    args = ap.parse_args()
+
+    weights = parse_weights(args.weight)
+    cities = load_city_list(args.russian_cities) if args.russian_cities else None
+    df = load_flights(args.input)
+    table = score(df, weights, cities, args.window_days, args.max_flights, args.ring_min)
+
+    for name in weights:
+        if name in table:
+            print(f"{name}: {int(table[name].sum())} IDs")
+    for row in table.head(args.top).itertuples(index=False):
+        print(f"{row.ID}: {row.score}")
+    write_frame(table, args.output, sep=";", lineterminator="\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,14 @@
 # -*- coding: utf-8 -*-
 import csv
+import io
+import os
 import re
+import shutil
+import tempfile
 
-COLUMNS = [
-    "real_first_name", "real_last_name", "birth_date", "p_source",
-    "flight_date", "flight_time", "flight_no", "codeshare",
-    "dep_city", "dep_airport", "dep_country",
-    "arr_city", "arr_airport", "arr_country",
-    "e_code", "e_ticket",
-    "docs", "seat", "meal", "booking_class", "fare_basis", "baggage", "loyalty_pairs"
-]
+from parallel_chunks import chunk_count, read_range, record_ranges, run_ordered, write_parts
+from schema import EXTENDED_COLUMNS as COLUMNS
+from table_io import TableWriter, compression_of, open_input, strip_compression_ext
 
 RE_HEAD = re.compile(
     r"""^(?P<PaxName>.+?)\s{2,}
@@ -30,64 +29,66 @@ RE_HEAD = re.compile(
 )
 
 
+MEAL_RE = re.compile(r"[A-Z]{3,4}")
+CLASS_RE = re.compile(r"[A-Z]")
+FARE_BAGGAGE_RE = re.compile(r"([A-Z][A-Z0-9]+?)(\d+PC|[0-9#F]|[0-9]{1,2}KG)", re.IGNORECASE)
+BAGGAGE_RE = re.compile(r"(?i:\d+PC|\d{1,2}KG)|[#FS0-9]")
+LOYALTY_PREFIX = "FF#"
+
+
 def parse_tail(rest: str):
     tokens = rest.split()
+    n = len(tokens)
     docs = seat = meal = booking_class = fare_basis = baggage = loyalty_pairs = ""
-    i = 0
-
-    if i < len(tokens):
-        if tokens[i].upper() == "N/A":
-            docs = "N/A"
-            i += 1
-        else:
-            if i + 1 < len(tokens) and tokens[i].isdigit() and tokens[i + 1].isdigit():
-                docs = f"{tokens[i]} {tokens[i + 1]}"
-                i += 2
-            else:
-                docs = tokens[i]
-                i += 1
-
-    if i < len(tokens):
+    if not n:
+        return docs, seat, meal, booking_class, fare_basis, baggage, loyalty_pairs
+
+    tok = tokens[0]
+    if tok.upper() == "N/A":
+        docs = "N/A"
+        i = 1
+    elif n > 1 and tok.isdigit() and tokens[1].isdigit():
+        docs = f"{tok} {tokens[1]}"
+        i = 2
+    else:
+        docs = tok
+        i = 1
+
+    if i < n:
         seat = tokens[i]
         i += 1
         if seat.upper() == "N/A":
             seat = ""
 
-    if i < len(tokens) and re.fullmatch(r"[A-Z]{3,4}", tokens[i]) and not re.fullmatch(r"[A-Z]", tokens[i]):
+    if i < n and MEAL_RE.fullmatch(tokens[i]):
         meal = tokens[i]
         i += 1
 
-    if i < len(tokens) and re.fullmatch(r"[A-Z]", tokens[i]):
+    if i < n and CLASS_RE.fullmatch(tokens[i]):
         booking_class = tokens[i]
         i += 1
 
-    if i < len(tokens):
-        fare_token = tokens[i]
+    if i < n:
+        core = tokens[i]
         i += 1
-        core = fare_token
         if booking_class and core.startswith(booking_class):
             core = core[1:]
 
-        m = re.match(r"^([A-Z][A-Z0-9]+?)(\d+PC|[0-9#F]|[0-9]{1,2}KG)$", core, flags=re.IGNORECASE)
+        m = FARE_BAGGAGE_RE.fullmatch(core)
         if m:
-            fare_basis = m.group(1)
-            baggage = m.group(2)
+            fare_basis, baggage = m.groups()
         else:
             fare_basis = core
-            if i < len(tokens):
-                nxt = tokens[i]
-                if (re.fullmatch(r"\d+PC", nxt, flags=re.IGNORECASE) or
-                        re.fullmatch(r"[#FS0-9]", nxt) or
-                        re.fullmatch(r"\d{1,2}KG", nxt, flags=re.IGNORECASE) or
-                        nxt.upper() in {"0PC", "1PC", "2PC"}):
-                    baggage = nxt
-                    i += 1
-
-    for j in range(i, len(tokens)):
-        if tokens[j].startswith("FF#"):
-            prog = tokens[j][3:].strip()
-            number = tokens[j + 1] if (j + 1 < len(tokens) and re.fullmatch(r"\d+", tokens[j + 1])) else ""
+            if i < n and BAGGAGE_RE.fullmatch(tokens[i]):
+                baggage = tokens[i]
+                i += 1
+
+    for j in range(i, n):
+        tok = tokens[j]
+        if tok.startswith(LOYALTY_PREFIX):
+            prog = tok[3:]
             if prog:
+                number = tokens[j + 1] if j + 1 < n and tokens[j + 1].isdecimal() else ""
                 loyalty_pairs = f"{prog}::{number}"
             break
 
@@ -97,7 +98,7 @@ def parse_tail(rest: str):
 def parse_line(line: str, p_source="tab"):
     m = RE_HEAD.match(line.rstrip())
     if not m:
-        return None, f"HEAD_PARSE_FAIL: {line[:160]}..."
+        return None, f"HEAD_PARSE_FAIL: {line.rstrip()[:160]}..."
 
     g = m.groupdict()
 
@@ -135,29 +136,95 @@ def parse_line(line: str, p_source="tab"):
     return row, None
 
 
-def convert(input_path: str, output_path: str, p_source="tab"):
-    bad = 0
-    with open(output_path, "w", newline="", encoding="utf-8") as fout, \
-            open(input_path, "r", encoding="utf-8") as fin:
+def parse_lines(lines, writer, rejects, p_source="tab"):
+    n = bad = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        row, err = parse_line(line, p_source)
+        if row:
+            writer.writerow(row)
+            n += 1
+        else:
+            rejects.write(err + "\n")
+            bad += 1
+    return n, bad
+
+
+def parse_chunk(task):
+    """Worker: parse one newline-aligned byte range into header-less CSV and rejects parts."""
+    input_path, start, end, p_source, part_path, rejects_path = task
+    text = read_range(input_path, start, end).decode("utf-8")
+    with open(part_path, "w", encoding="utf-8", newline="") as fout, \
+            open(rejects_path, "w", encoding="utf-8") as frej:
         writer = csv.DictWriter(fout, fieldnames=COLUMNS, delimiter=";", lineterminator="\n")
-        writer.writeheader()
-
-        first = fin.readline()
-        if first and not first.strip().startswith("PaxName"):
-            row, err = parse_line(first, p_source)
-            if row:
-                writer.writerow(row)
-            else:
-                bad += 1
-
-        for line in fin:
-            if not line.strip():
-                continue
-            row, err = parse_line(line, p_source)
-            if row:
-                writer.writerow(row)
-            else:
-                bad += 1
+        return parse_lines(io.StringIO(text, newline=None), writer, frej, p_source)
+
+
+def convert_parallel(input_path: str, output_path: str, rejects, p_source: str, workers: int):
+    with open(input_path, "rb") as f:
+        first = f.readline()
+    n = bad = 0
+    first_text = first.decode("utf-8")
+    tmp_dir = tempfile.mkdtemp(prefix=".tab_parts_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        head_part = os.path.join(tmp_dir, "head.csv")
+        with open(head_part, "w", encoding="utf-8", newline="") as fout:
+            if first_text and not first_text.strip().startswith("PaxName"):
+                writer = csv.DictWriter(fout, fieldnames=COLUMNS, delimiter=";", lineterminator="\n")
+                row, err = parse_line(first_text, p_source)
+                if row:
+                    writer.writerow(row)
+                    n += 1
+                else:
+                    rejects.write(err + "\n")
+                    bad += 1
+
+        ranges = record_ranges(input_path, chunk_count(workers), len(first), quote=b"")
+        parts = [os.path.join(tmp_dir, f"part{k:05d}.csv") for k in range(len(ranges))]
+        rejected = [os.path.join(tmp_dir, f"rejects{k:05d}.txt") for k in range(len(ranges))]
+        tasks = [(input_path, s, e, p_source, part, rej)
+                 for (s, e), part, rej in zip(ranges, parts, rejected)]
+        for n_rows, n_bad in run_ordered(parse_chunk, tasks, workers):
+            n += n_rows
+            bad += n_bad
+
+        write_parts([head_part] + parts, output_path, COLUMNS)
+        for rej in rejected:
+            with open(rej, "r", encoding="utf-8") as f:
+                shutil.copyfileobj(f, rejects)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return n, bad
+
+
+def convert(input_path: str, output_path: str, p_source="tab", workers: int = 1, rejects_path: str = ""):
+    rejects_path = rejects_path or os.path.splitext(strip_compression_ext(output_path))[0] + "_rejects.txt"
+    with open(rejects_path, "w", encoding="utf-8") as rejects:
+        if workers > 1 and not compression_of(input_path, sniff=True):
+            n, bad = convert_parallel(input_path, output_path, rejects, p_source, workers)
+        else:
+            n = bad = 0
+            with TableWriter(output_path, COLUMNS, lineterminator="\n") as writer, \
+                    open_input(input_path, "r", encoding="utf-8") as fin:
+
+                first = fin.readline()
+                if first and not first.strip().startswith("PaxName"):
+                    row, err = parse_line(first, p_source)
+                    if row:
+                        writer.writerow(row)
+                        n += 1
+                    else:
+                        rejects.write(err + "\n")
+                        bad += 1
+
+                n_rows, n_bad = parse_lines(fin, writer, rejects, p_source)
+                n += n_rows
+                bad += n_bad
+
+    if bad:
+        print(f"Parsed rows: {n}, rejected lines: {bad} (see {rejects_path})")
+    return n, bad
 
 
 if __name__ == "__main__":
@@ -167,5 +234,10 @@ if __name__ == "__main__":
     ap.add_argument("input_tab")
     ap.add_argument("output_csv")
     ap.add_argument("--source", dest="p_source", default="tab")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Parse newline-aligned chunks of the input in this many processes.")
+    ap.add_argument("--rejects", default="",
+                    help="File for unparsed lines (default: <output>_rejects.txt).")
     args = ap.parse_args()
-    convert(args.input_tab, args.output_csv, p_source=args.p_source)
+    convert(args.input_tab, args.output_csv, p_source=args.p_source, workers=args.workers,
+            rejects_path=args.rejects)
@@ -0,0 +1,363 @@
+import bz2
+import csv
+import gzip
+import io
+import lzma
+import os
+import queue
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CSV_DELIM = ";"
+PARQUET_EXTS = (".parquet", ".pq")
+ARROW_EXTS = (".arrow", ".feather", ".ipc")
+
+COMPRESSION_EXTS = {".gz": "gzip", ".zst": "zstd", ".zstd": "zstd", ".bz2": "bz2", ".xz": "xz"}
+MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+)
+IO_BLOCK = 1024 * 1024
+PREFETCH_BLOCKS = 8
+
+BATCH_ROWS = 64 * 1024
+# a column is dictionary-encoded when its first batch has at most this share of distinct values
+DICT_MAX_RATIO = 0.5
+
+
+def strip_compression_ext(path: str) -> str:
+    base, ext = os.path.splitext(path)
+    return base if ext.lower() in COMPRESSION_EXTS else path
+
+
+def compression_of(path: str, sniff: bool = False):
+    kind = COMPRESSION_EXTS.get(os.path.splitext(path)[1].lower())
+    if kind or not sniff or not os.path.isfile(path):
+        return kind
+    with open(path, "rb") as f:
+        head = f.read(6)
+    for magic, name in MAGIC:
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def _zstd():
+    if zstandard is None:
+        raise RuntimeError("zstd streams need the 'zstandard' package")
+    return zstandard
+
+
+_OPENERS = {
+    "gzip": gzip.open,
+    "bz2": bz2.open,
+    "xz": lzma.open,
+    "zstd": lambda path, mode: _zstd().open(path, mode),
+}
+
+
+class _PrefetchReader(io.RawIOBase):
+    """Raw stream fed by a thread that reads (and decompresses) ahead of the consumer."""
+
+    def __init__(self, raw, block: int = IO_BLOCK, depth: int = PREFETCH_BLOCKS):
+        self._raw = raw
+        self._q = queue.Queue(maxsize=depth)
+        self._buf = b""
+        self._pos = 0
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._pump, args=(block,), daemon=True)
+        self._thread.start()
+
+    def _pump(self, block: int):
+        try:
+            while not self._stop.is_set():
+                data = self._raw.read(block)
+                if not data:
+                    break
+                self._q.put(data)
+        except Exception as e:
+            self._q.put(e)
+            return
+        self._q.put(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._pos >= len(self._buf):
+            if self._eof:
+                return 0
+            item = self._q.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._buf, self._pos = item, 0
+        n = min(len(b), len(self._buf) - self._pos)
+        b[:n] = self._buf[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            while self._thread.is_alive():
+                try:
+                    self._q.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self._raw.close()
+        super().close()
+
+
+def open_input(path: str, mode: str = "rb", encoding: str = "utf-8", errors: str = "strict",
+               newline=None):
+    """open() that transparently decompresses gzip/zstd/bz2/xz inputs.
+
+    Compressed streams are decompressed by a background thread so that
+    decompression overlaps with the caller's parsing.
+    """
+    kind = compression_of(path, sniff=True)
+    if kind is None:
+        if "b" in mode:
+            return open(path, "rb")
+        return open(path, "r", encoding=encoding, errors=errors, newline=newline)
+    stream = io.BufferedReader(_PrefetchReader(_OPENERS[kind](path, "rb")), IO_BLOCK)
+    if "b" in mode:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding, errors=errors, newline=newline)
+
+
+def open_output(path: str, mode: str = "wb", encoding: str = "utf-8", newline=None,
+                buffering: int = -1):
+    """open() for writing that compresses when the path ends in .gz/.zst/.bz2/.xz."""
+    kind = compression_of(path)
+    if kind is None:
+        if "b" in mode:
+            return open(path, "wb", buffering=buffering)
+        return open(path, "w", encoding=encoding, newline=newline, buffering=buffering)
+    stream = _OPENERS[kind](path, "wb")
+    if "b" in mode:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding, newline=newline)
+
+
+def table_format(path: str) -> str:
+    ext = os.path.splitext(strip_compression_ext(path))[1].lower()
+    if ext in PARQUET_EXTS:
+        return "parquet"
+    if ext in ARROW_EXTS:
+        return "arrow"
+    return "csv"
+
+
+def is_columnar(path: str) -> bool:
+    return table_format(path) != "csv"
+
+
+def _open_arrow(path: str):
+    return pa.ipc.open_file(pa.memory_map(path, "r"))
+
+
+def table_columns(path: str, sep: str = CSV_DELIM) -> list:
+    fmt = table_format(path)
+    if fmt == "parquet":
+        return pq.read_schema(path, memory_map=True).names
+    if fmt == "arrow":
+        return _open_arrow(path).schema.names
+    with open_input(path, "r", encoding="utf-8-sig", newline="", errors="replace") as f:
+        return next(csv.reader(f, delimiter=sep), [])
+
+
+def _string_table(table: pa.Table) -> pa.Table:
+    cols = []
+    for col in table.columns:
+        if not pa.types.is_string(col.type) and not pa.types.is_large_string(col.type):
+            col = col.cast(pa.string())
+        cols.append(col.fill_null(""))
+    return pa.table(cols, names=table.column_names)
+
+
+def read_arrow_table(path: str, columns=None) -> pa.Table:
+    """Memory-mapped read of a Parquet/Arrow file, optionally only some columns."""
+    if table_format(path) == "parquet":
+        return pq.read_table(path, columns=columns, memory_map=True)
+    table = _open_arrow(path).read_all()
+    return table.select(columns) if columns is not None else table
+
+
+def read_frame(path: str, columns=None, sep: str = CSV_DELIM) -> pd.DataFrame:
+    """Load a table as string columns with "" for missing values."""
+    if is_columnar(path):
+        return _string_table(read_arrow_table(path, columns)).to_pandas()
+    if compression_of(path, sniff=True):
+        with open_input(path) as f:
+            return pd.read_csv(f, sep=sep, dtype=str, keep_default_na=False, usecols=columns,
+                               encoding="utf-8-sig")
+    return pd.read_csv(path, sep=sep, dtype=str, keep_default_na=False, usecols=columns,
+                       encoding="utf-8-sig")
+
+
+def read_records(path: str, sep: str = CSV_DELIM, **csv_kwargs):
+    """Return (header, iterator over rows as lists of str) for any supported format."""
+    if not is_columnar(path):
+        f = open_input(path, "r", encoding="utf-8-sig", newline="", errors="replace")
+        reader = csv.reader(f, delimiter=sep, **csv_kwargs)
+        header = next(reader, [])
+
+        def rows():
+            with f:
+                yield from reader
+        return header, rows()
+
+    if table_format(path) == "parquet":
+        pf = pq.ParquetFile(path, memory_map=True)
+        header = pf.schema_arrow.names
+        batches = pf.iter_batches(batch_size=BATCH_ROWS)
+    else:
+        reader = _open_arrow(path)
+        header = reader.schema.names
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+
+    def rows():
+        for batch in batches:
+            table = _string_table(pa.Table.from_batches([batch]))
+            yield from (list(r) for r in zip(*(c.to_pylist() for c in table.columns)))
+    return header, rows()
+
+
+class TableWriter:
+    """DictWriter-like sink that writes `;` CSV, Parquet or Arrow IPC by extension.
+
+    CSV paths ending in .gz/.zst/.bz2/.xz are compressed on the fly.
+
+    Columnar outputs are written in record batches of BATCH_ROWS rows; columns
+    whose first batch is low-cardinality are dictionary-encoded.
+    """
+
+    def __init__(self, path: str, fieldnames, sep: str = CSV_DELIM, lineterminator: str = "\r\n",
+                 buffering: int = -1, **csv_kwargs):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.format = table_format(path)
+        self.sep = sep
+        self.lineterminator = lineterminator
+        self._writer = None
+        self._dicts = None
+        self._buf = [[] for _ in self.fieldnames]
+        if self.format == "csv":
+            self._f = open_output(path, "w", encoding="utf-8", newline="", buffering=buffering)
+            self._csv = csv.DictWriter(self._f, fieldnames=self.fieldnames, delimiter=sep,
+                                       lineterminator=lineterminator, **csv_kwargs)
+            self._csv.writeheader()
+            self._rows = csv.writer(self._f, delimiter=sep, lineterminator=lineterminator, **csv_kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def writerow(self, row: dict):
+        if self.format == "csv":
+            self._csv.writerow(row)
+            return
+        for buf, col in zip(self._buf, self.fieldnames):
+            v = row.get(col, "")
+            buf.append("" if v is None else str(v))
+        if len(self._buf[0]) >= BATCH_ROWS:
+            self._flush()
+
+    def writerows(self, rows):
+        if self.format == "csv":
+            self._csv.writerows(rows)
+            return
+        for row in rows:
+            self.writerow(row)
+
+    def writetuples(self, rows):
+        """Write rows given as sequences in fieldnames order."""
+        if self.format == "csv":
+            self._rows.writerows(rows)
+            return
+        for row in rows:
+            for buf, v in zip(self._buf, row):
+                buf.append("" if v is None else str(v))
+            if len(self._buf[0]) >= BATCH_ROWS:
+                self._flush()
+
+    def write_frame(self, df: pd.DataFrame):
+        df = df.reindex(columns=self.fieldnames)
+        if self.format == "csv":
+            df.to_csv(self._f, sep=self.sep, index=False, header=False,
+                      lineterminator=self.lineterminator)
+            return
+        self._flush()
+        for start in range(0, len(df), BATCH_ROWS):
+            part = df.iloc[start:start + BATCH_ROWS]
+            self._write_columns([part[c].fillna("").astype(str).tolist() for c in self.fieldnames])
+
+    def _flush(self):
+        if self._buf[0]:
+            cols, self._buf = self._buf, [[] for _ in self.fieldnames]
+            self._write_columns(cols)
+
+    def _open_columnar(self, cols):
+        n = max(1, len(cols[0]))
+        dict_cols = [name for name, values in zip(self.fieldnames, cols)
+                     if len(set(values)) <= n * DICT_MAX_RATIO]
+        if self.format == "parquet":
+            schema = pa.schema([(name, pa.string()) for name in self.fieldnames])
+            self._writer = pq.ParquetWriter(self.path, schema, use_dictionary=dict_cols or False)
+            self._dicts = {}
+        else:
+            self._dicts = {name: {} for name in dict_cols}
+            schema = pa.schema([
+                (name, pa.dictionary(pa.int32(), pa.string()) if name in self._dicts else pa.string())
+                for name in self.fieldnames
+            ])
+            opts = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self._writer = pa.ipc.new_file(self.path, schema, options=opts)
+        self._schema = schema
+
+    def _encode(self, name, values):
+        index = self._dicts.get(name)
+        if index is None:
+            return pa.array(values, type=pa.string())
+        codes = [index.setdefault(v, len(index)) for v in values]
+        # the dictionary only grows, so every batch is a delta of the previous one
+        return pa.DictionaryArray.from_arrays(pa.array(codes, type=pa.int32()),
+                                              pa.array(list(index), type=pa.string()))
+
+    def _write_columns(self, cols):
+        if self._writer is None:
+            self._open_columnar(cols)
+        arrays = [self._encode(name, values) for name, values in zip(self.fieldnames, cols)]
+        self._writer.write_batch(pa.record_batch(arrays, schema=self._schema))
+
+    def close(self):
+        if self.format == "csv":
+            self._f.close()
+            return
+        self._flush()
+        if self._writer is None:
+            self._open_columnar([[] for _ in self.fieldnames])
+        self._writer.close()
+
+
+def write_frame(df: pd.DataFrame, path: str, sep: str = CSV_DELIM, lineterminator: str = "\r\n",
+                **csv_kwargs):
+    with TableWriter(path, df.columns, sep=sep, lineterminator=lineterminator, **csv_kwargs) as w:
+        w.write_frame(df)
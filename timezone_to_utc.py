@@ -5,22 +5,13 @@ import sys
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 
-COLUMNS = [
-    "real_first_name", "real_last_name", "birth_date",
-    "flight_date", "flight_time", "flight_no", "codeshare",
-    "dep_city", "dep_airport", "arr_city", "arr_airport",
-    "e_code", "e_ticket", "docs", "seat", "meal",
-    "booking_class", "fare_basis", "baggage", "loyalty_pairs",
-]
+from schema import TARGET_COLUMNS as COLUMNS, normalize_header, row_projector
+from table_io import TableWriter, read_records
 
 INPUT_DELIM = ";"
 OUTPUT_DELIM = ";"
 
 
-def normalize_header(name: str) -> str:
-    return " ".join(name.strip().split())
-
-
 def normalize_date(s: str) -> str:
     if not s or not s.strip():
         return ""
@@ -118,54 +109,27 @@ def main():
 
     iata2tz = load_iata_tz_map(tz_map_csv)
 
-    with open(in_csv, "r", encoding="utf-8-sig", newline="", errors="replace") as fin:
-        reader = csv.reader(fin, delimiter=INPUT_DELIM, skipinitialspace=True)
-        try:
-            raw_header = next(reader)
-        except StopIteration:
-            with open(out_csv, "w", encoding="utf-8", newline="") as fout:
-                writer = csv.writer(fout, delimiter=OUTPUT_DELIM)
-                writer.writerow(COLUMNS)
-            return
-
-        header = [normalize_header(h) for h in raw_header]
-
-        rows = []
-        for r in reader:
-            if len(r) < len(header):
-                r = r + [""] * (len(header) - len(r))
-            elif len(r) > len(header):
-                r = r[:len(header)]
-            row = {}
-            for i, h in enumerate(header):
-                v = r[i]
-                row[h] = v.strip() if isinstance(v, str) else v
-            rows.append(row)
-
-    updated = 0
-    skipped = 0
-    for row in rows:
-        dep = (row.get("dep_airport") or "").strip().upper()
-        tz_name = iata2tz.get(dep, "")
-        fd = row.get("flight_date", "")
-        ft = row.get("flight_time", "")
-        converted = to_utc(fd, ft, tz_name)
-        if converted is None:
-            skipped += 1
-            continue
-        new_d, new_t = converted
-        row["flight_date"] = new_d
-        row["flight_time"] = new_t
-        updated += 1
+    raw_header, reader = read_records(in_csv, INPUT_DELIM, skipinitialspace=True)
+    if not raw_header:
+        TableWriter(out_csv, COLUMNS, sep=OUTPUT_DELIM).close()
+        return
 
+    header = [normalize_header(h) for h in raw_header]
     extra = [c for c in header if c not in COLUMNS]
     out_fields = COLUMNS + extra
+    project = row_projector(header, out_fields, normalize_header)
+    i_date, i_time, i_dep = (out_fields.index(c) for c in ("flight_date", "flight_time", "dep_airport"))
 
-    with open(out_csv, "w", encoding="utf-8", newline="") as fout:
-        writer = csv.DictWriter(fout, fieldnames=out_fields, delimiter=OUTPUT_DELIM)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow(row)
+    def rows():
+        for r in reader:
+            row = [v.strip() for v in project(r)]
+            converted = to_utc(row[i_date], row[i_time], iata2tz.get(row[i_dep].upper(), ""))
+            if converted is not None:
+                row[i_date], row[i_time] = converted
+            yield row
+
+    with TableWriter(out_csv, out_fields, sep=OUTPUT_DELIM) as writer:
+        writer.writetuples(rows())
 
 
 if __name__ == "__main__":
@@ -4,18 +4,12 @@ import os
 import pandas as pd
 from openpyxl import load_workbook
 
+from schema import EXTENDED_COLUMNS as COLUMNS
+from table_io import is_columnar, write_frame
+
 input_dir = "./unzipped_xlsx"
 output_csv = "flights_parsed.csv"
 
-COLUMNS = [
-    "real_first_name", "real_last_name", "birth_date", "p_source",
-    "flight_date", "flight_time", "flight_no", "codeshare",
-    "dep_city", "dep_airport", "dep_country",
-    "arr_city", "arr_airport", "arr_country",
-    "e_code", "e_ticket", "docs", "seat", "meal",
-    "booking_class", "fare_basis", "baggage", "loyalty_pairs"
-]
-
 rows = []
 
 for path in glob.glob(os.path.join(input_dir, "*.xlsx")):
@@ -67,4 +61,7 @@ for path in glob.glob(os.path.join(input_dir, "*.xlsx")):
 
 result_df = pd.DataFrame(rows, columns=COLUMNS)
 
-result_df.to_csv(output_csv, sep=";", index=False, encoding="utf-8-sig")
+if is_columnar(output_csv):
+    write_frame(result_df, output_csv)
+else:
+    result_df.to_csv(output_csv, sep=";", index=False, encoding="utf-8-sig")
@@ -1,11 +1,27 @@
 import argparse
 import csv
+import io
 import os
 import re
+import shutil
+import tempfile
 import xml.etree.ElementTree as ET
 
+from parallel_chunks import chunk_count, element_ranges, read_range, run_ordered, write_parts
+from table_io import TableWriter, compression_of, open_input, strip_compression_ext
+
+try:
+    from lxml import etree as LET
+except ImportError:
+    LET = None
+
 ALNUM_RE = re.compile(r"[^A-Za-z0-9]")
 
+EVENT_TAGS = ("user", "name", "card", "activity")
+ACTIVITY_TAGS = frozenset({"Code", "Date", "Departure", "Arrival", "Fare"})
+BATCH_ROWS = 4096
+USER_TAG = b"<user"
+
 COLUMNS = [
     "uid",
     "real_first_name",
@@ -34,80 +50,145 @@ def clean_number(s: str) -> str:
     return ALNUM_RE.sub("", (s or ""))
 
 
-def parse_xml_to_csv(input_xml: str, output_csv: str, p_source_hint: str = ""):
-    p_source = (p_source_hint or os.path.splitext(os.path.basename(input_xml))[0]).strip()
-
-    with open(output_csv, "w", newline="", encoding="utf-8", buffering=1024 * 1024) as fout:
-        writer = csv.DictWriter(
-            fout, fieldnames=COLUMNS, delimiter=";", lineterminator="\n", quoting=csv.QUOTE_MINIMAL
-        )
-        writer.writeheader()
-
-        cur_uid = ""
-        cur_first = ""
-        cur_last = ""
-        cur_prog = ""
-        cur_prog_number = ""
-
-        for event, elem in ET.iterparse(input_xml, events=("start", "end")):
-            tag = elem.tag
-
-            if event == "start":
-                if tag == "user":
-                    cur_uid = (elem.attrib.get("uid") or "").strip()
-                    cur_first = cur_last = ""
-                    cur_prog = cur_prog_number = ""
-                elif tag == "name":
-                    cur_first = (elem.attrib.get("first") or "").strip()
-                    cur_last = (elem.attrib.get("last") or "").strip()
-                elif tag == "card":
-                    card_num = (elem.attrib.get("number") or "").strip()
-                    parts = card_num.split(None, 1)
-                    cur_prog = upcode(parts[0]) if parts else ""
-                    cur_prog_number = clean_number(parts[1]) if len(parts) > 1 else ""
-                continue
-
-            if tag == "activity":
-                if (elem.attrib.get("type") or "").strip().lower() == "flight":
-                    flight_no = upcode(elem.findtext("Code") or "")
-                    flight_date = (elem.findtext("Date") or "").strip()
-                    dep_airport = upcode(elem.findtext("Departure") or "")
-                    arr_airport = upcode(elem.findtext("Arrival") or "")
-                    fare_basis = (elem.findtext("Fare") or "").strip()
-
-                    loyalty_pairs = f"{cur_prog}::{cur_prog_number}"
-
-                    row = {
-                        "uid": cur_uid,
-                        "real_first_name": cur_first,
-                        "real_last_name": cur_last,
-                        "p_source": p_source,
-                        "flight_date": flight_date,
-                        "flight_no": flight_no,
-                        "codeshare": "0",
-                        "dep_city": "",
-                        "dep_airport": dep_airport,
-                        "dep_country": "",
-                        "arr_city": "",
-                        "arr_airport": arr_airport,
-                        "arr_country": "",
-                        "nickname": "",
-                        "docs_pairs": "",
-                        "loyalty_pairs": loyalty_pairs,
-                        "booking_class": "",
-                        "fare_basis": fare_basis,
-                        "n_docs": "0",
-                        "n_loyalty": "1",
-                    }
-                    writer.writerow(row)
-
-                elem.clear()
-
-            elif tag in ("card", "user", "activities", "cards", "name"):
-                elem.clear()
-
-            else:
-                pass
+def _iterparse(fin):
+    if LET is not None:
+        return LET.iterparse(fin, events=("start", "end"), tag=EVENT_TAGS, resolve_entities=False)
+    return ET.iterparse(fin, events=("start", "end"))
+
+
+def _release(elem):
+    """Free an element that has been fully handled, with its earlier siblings."""
+    elem.clear()
+    if LET is not None:
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+
+
+def iter_flight_rows(fin, p_source: str):
+    """Yield one tuple in COLUMNS order per flight activity of the XML stream."""
+    root = None
+    cur_uid = ""
+    cur_first = ""
+    cur_last = ""
+    loyalty_pairs = "::"
+
+    for event, elem in _iterparse(fin):
+        tag = elem.tag
+
+        if event == "start":
+            if root is None:
+                root = elem
+            if tag == "user":
+                cur_uid = (elem.attrib.get("uid") or "").strip()
+                cur_first = cur_last = ""
+                loyalty_pairs = "::"
+            elif tag == "name":
+                cur_first = (elem.attrib.get("first") or "").strip()
+                cur_last = (elem.attrib.get("last") or "").strip()
+            elif tag == "card":
+                card_num = (elem.attrib.get("number") or "").strip()
+                parts = card_num.split(None, 1)
+                cur_prog = upcode(parts[0]) if parts else ""
+                cur_prog_number = clean_number(parts[1]) if len(parts) > 1 else ""
+                loyalty_pairs = f"{cur_prog}::{cur_prog_number}"
+            continue
+
+        if tag == "activity":
+            if (elem.attrib.get("type") or "").strip().lower() == "flight":
+                fields = {}
+                for child in elem:
+                    if child.tag in ACTIVITY_TAGS and child.tag not in fields:
+                        fields[child.tag] = child.text or ""
+                yield (
+                    cur_uid, cur_first, cur_last, p_source,
+                    fields.get("Date", "").strip(),
+                    upcode(fields.get("Code", "")),
+                    "0",
+                    "", upcode(fields.get("Departure", "")), "",
+                    "", upcode(fields.get("Arrival", "")), "",
+                    "", "", loyalty_pairs, "",
+                    fields.get("Fare", "").strip(),
+                    "0", "1",
+                )
+            _release(elem)
+
+        elif tag in ("card", "name"):
+            _release(elem)
+
+        elif tag == "user":
+            _release(elem)
+            if LET is None and root is not None:
+                root.clear()
+
+
+def write_rows(rows, writer: TableWriter):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_ROWS:
+            writer.writetuples(batch)
+            batch = []
+    if batch:
+        writer.writetuples(batch)
+
+
+def xml_prolog(path: str) -> bytes:
+    with open(path, "rb") as f:
+        head = f.read(1024)
+    if head.startswith(b"<?xml"):
+        end = head.find(b"?>")
+        if end >= 0:
+            return head[:end + 2]
+    return b""
+
+
+def parse_fragment(task) -> int:
+    """Worker: parse one run of <user> elements into a header-less CSV part."""
+    input_xml, start, end, prolog, p_source, part_path = task
+    fragment = prolog + b"<fragment>" + read_range(input_xml, start, end) + b"</fragment>"
+    n = 0
+    with open(part_path, "w", encoding="utf-8", newline="") as fout:
+        writer = csv.writer(fout, delimiter=";", lineterminator="\n", quoting=csv.QUOTE_MINIMAL)
+        for row in iter_flight_rows(io.BytesIO(fragment), p_source):
+            writer.writerow(row)
+            n += 1
+    return n
+
+
+def parse_xml_parallel(input_xml: str, output_csv: str, p_source: str, workers: int) -> bool:
+    """Split the document at <user> boundaries and parse the pieces in a process pool.
+
+    Returns False when the input cannot be split (compressed or no users found).
+    """
+    if compression_of(input_xml, sniff=True):
+        return False
+    ranges = element_ranges(input_xml, chunk_count(workers), USER_TAG)
+    if not ranges:
+        return False
+
+    prolog = xml_prolog(input_xml)
+    tmp_dir = tempfile.mkdtemp(prefix=".xml_parts_", dir=os.path.dirname(os.path.abspath(output_csv)))
+    parts = [os.path.join(tmp_dir, f"part{k:05d}.csv") for k in range(len(ranges))]
+    tasks = [(input_xml, s, e, prolog, p_source, part) for (s, e), part in zip(ranges, parts)]
+    try:
+        run_ordered(parse_fragment, tasks, workers)
+        write_parts(parts, output_csv, COLUMNS)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return True
+
+
+def parse_xml_to_csv(input_xml: str, output_csv: str, p_source_hint: str = "", workers: int = 1):
+    p_source = (p_source_hint or os.path.splitext(os.path.basename(strip_compression_ext(input_xml)))[0]).strip()
+
+    if workers > 1 and parse_xml_parallel(input_xml, output_csv, p_source, workers):
+        return
+
+    with TableWriter(output_csv, COLUMNS, lineterminator="\n", buffering=1024 * 1024,
+                     quoting=csv.QUOTE_MINIMAL) as writer, open_input(input_xml) as fin:
+        write_rows(iter_flight_rows(fin, p_source), writer)
 
 
 def main():
@@ -115,9 +196,11 @@ def main():
     ap.add_argument("input_xml")
     ap.add_argument("output_csv")
     ap.add_argument("--source", dest="p_source", default="")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Parse runs of <user> elements in this many processes.")
     args = ap.parse_args()
 
-    parse_xml_to_csv(args.input_xml, args.output_csv, p_source_hint=args.p_source)
+    parse_xml_to_csv(args.input_xml, args.output_csv, p_source_hint=args.p_source, workers=args.workers)
 
 
 if __name__ == "__main__":
@@ -5,6 +5,8 @@ import re
 
 import yaml
 
+from table_io import TableWriter, open_input, strip_compression_ext
+
 ALNUM_RE = re.compile(r"[^A-Za-z0-9]")
 
 COLUMNS = [
@@ -47,7 +49,7 @@ def yaml_iter(yaml_root: dict):
 
 
 def rows_from_yaml(input_path: str, p_source: str):
-    with open(input_path, "r", encoding="utf-8") as f:
+    with open_input(input_path, "r", encoding="utf-8") as f:
         data = yaml.safe_load(f)
 
     for flight_date, flight_no, dep_airport, arr_airport, ff in yaml_iter(data):
@@ -101,13 +103,10 @@ def parse_args():
 
 def main():
     args = parse_args()
-    p_source = args.p_source.strip() or os.path.splitext(os.path.basename(args.input_yaml))[0]
+    p_source = args.p_source.strip() or os.path.splitext(os.path.basename(strip_compression_ext(args.input_yaml)))[0]
 
-    with open(args.output_csv, "w", newline="", encoding="utf-8", buffering=1024 * 1024) as fout:
-        writer = csv.DictWriter(
-            fout, fieldnames=COLUMNS, delimiter=";", lineterminator="\n", quoting=csv.QUOTE_MINIMAL
-        )
-        writer.writeheader()
+    with TableWriter(args.output_csv, COLUMNS, lineterminator="\n", buffering=1024 * 1024,
+                     quoting=csv.QUOTE_MINIMAL) as writer:
         for row in rows_from_yaml(args.input_yaml, p_source):
             writer.writerow(row)
 